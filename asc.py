@@ -0,0 +1,223 @@
+"""
+This script reads eyetracking data back from the .asc export of the .edf files (made with edf2asc),
+without loading whole files into memory: samples go to a memory-mapped file, events and
+messages (triggers) to small tables next to it.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+usage:
+
+    python asc.py 12_3456.asc 13_3457.asc --out parsed [--processes 4]
+    python asc.py --synthetic synthetic.asc [--seconds 60]     # make an .asc file to test with
+
+    from asc import load_samples, load_events
+
+    samples = load_samples("parsed/12_3456")    # numpy memmap, see SAMPLE_DTYPE
+    events = load_events("parsed/12_3456")      # dict of arrays: fixations, saccades, blinks, triggers, messages
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from audit import TRIGGER_MESSAGE
+
+SAMPLE_DTYPE = np.dtype([("time", "<f8"), ("x", "<f4"), ("y", "<f4"), ("pupil", "<f4")])
+
+# Event tables, as {event: (asc line start, columns after the eye)}
+EVENTS = {
+    "fixations": ("EFIX", ["start", "end", "duration", "x", "y", "pupil"]),
+    "saccades": (
+        "ESACC",
+        ["start", "end", "duration", "start_x", "start_y", "end_x", "end_y", "amplitude", "peak_velocity"],
+    ),
+    "blinks": ("EBLINK", ["start", "end", "duration"]),
+}
+
+
+def parse_asc(path, out_directory, chunk_size=1 << 24):
+    """
+    Reads `path` in chunks of about `chunk_size` bytes. Samples are appended to
+    <out_directory>/<name>_samples.bin (SAMPLE_DTYPE records, missing values as NaN),
+    events and messages saved in <name>_events.npz. Returns the path without the suffixes.
+    """
+    os.makedirs(out_directory, exist_ok=True)
+    prefix = os.path.join(out_directory, os.path.splitext(os.path.basename(path))[0])
+
+    # With both eyes recorded, samples are: time, left x, y, pupil, right x, y, pupil
+    columns = slice(1, 4)
+    events = {name: [] for name in EVENTS}
+    triggers = []
+    messages = []
+
+    with open(path, errors="replace") as file, open(f"{prefix}_samples.bin", "wb") as samples:
+        while True:
+            lines = file.readlines(chunk_size)
+            if not lines:
+                break
+
+            sample_lines = []
+            for line in lines:
+                if line[:1].isdigit():
+                    sample_lines.append(line)
+                elif line.startswith("MSG"):
+                    match = TRIGGER_MESSAGE.match(line)
+                    if match:
+                        time, offset, code = match.groups()
+                        triggers.append((float(time) - float(offset or 0), int(code)))
+                    else:
+                        time, _, text = line[4:].strip().partition(" ")
+                        messages.append((float(time), text))
+                elif line.startswith("SAMPLES") and "LEFT" in line and "RIGHT" in line:
+                    # The experiment records the right eye
+                    columns = slice(4, 7)
+                else:
+                    for name, (start, _) in EVENTS.items():
+                        if line.startswith(start):
+                            events[name].append(line.split()[2:])
+                            break
+
+            if sample_lines:
+                samples.write(samples_to_records(sample_lines, columns).tobytes())
+
+    np.savez(
+        f"{prefix}_events.npz",
+        **{name: to_table(rows, EVENTS[name][1]) for name, rows in events.items()},
+        triggers=np.array(triggers, dtype=[("time", "<f8"), ("code", "<i8")]),
+        message_times=np.array([time for time, _ in messages], dtype="<f8"),
+        message_texts=np.array([text for _, text in messages], dtype=str),
+    )
+
+    return prefix
+
+
+def samples_to_records(lines, columns):
+    # Missing values (e.g. during blinks) are written as '.'
+    values = [line.split() for line in lines]
+    times = np.array([row[0] for row in values], dtype="<f8")
+    gaze = np.array(
+        [[value if value != "." else "nan" for value in row[columns]] for row in values],
+        dtype="<f4",
+    )
+
+    records = np.empty(len(lines), dtype=SAMPLE_DTYPE)
+    records["time"] = times
+    records["x"], records["y"], records["pupil"] = gaze.T
+
+    return records
+
+
+def to_table(rows, columns):
+    table = np.array(
+        [[value if value != "." else "nan" for value in row[: len(columns)]] for row in rows],
+        dtype="<f8",
+    ).reshape(len(rows), len(columns))
+
+    return np.rec.fromarrays(table.T, names=columns)
+
+
+def parse_files(paths, out_directory, processes=None):
+    """Parses every file on its own process, returns the prefixes (see load_samples)."""
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(parse_asc, paths, [out_directory] * len(paths)))
+
+
+def load_samples(prefix):
+    """Returns the samples as a (read-only) numpy memmap of SAMPLE_DTYPE records."""
+    n_samples = os.path.getsize(f"{prefix}_samples.bin") // SAMPLE_DTYPE.itemsize
+    if n_samples == 0:
+        return np.zeros(0, dtype=SAMPLE_DTYPE)
+
+    return np.memmap(f"{prefix}_samples.bin", dtype=SAMPLE_DTYPE, mode="r", shape=(n_samples,))
+
+
+def load_events(prefix):
+    with np.load(f"{prefix}_events.npz") as events:
+        return {name: events[name] for name in events.files}
+
+
+def write_synthetic_asc(path, seconds=60, rate=1000, n_trials=10, seed=0):
+    """
+    Writes an .asc file like edf2asc makes of a recording of the right eye: fixational drift
+    with a microsaccade every second or so, a few blinks, and the triggers of `n_trials`
+    trials. Returns the onsets (ms) and displacements (px) of the microsaccades that were put in.
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = int(seconds * rate)
+    start_time = 1_000_000
+    times = start_time + np.arange(n_samples) * 1000 // rate
+
+    # Drift (a random walk) around the centre of the screen
+    position = np.cumsum(rng.normal(0, 0.05, (n_samples, 2)), axis=0) + (960, 540)
+
+    # Microsaccades: a quick step of a few pixels over ~15 ms
+    onsets = np.sort(rng.choice(np.arange(100, n_samples - 100), size=int(seconds), replace=False))
+    displacements = rng.normal(0, 1, (len(onsets), 2))
+    displacements *= rng.uniform(5, 15, (len(onsets), 1)) / np.linalg.norm(displacements, axis=1, keepdims=True)
+    velocity = np.zeros((n_samples, 2))
+    steps = (onsets[:, None] + np.arange(15)).ravel()
+    np.add.at(velocity, steps, np.repeat(displacements / 15, 15, axis=0))
+    position += np.cumsum(velocity, axis=0)
+
+    pupil = 1200 + rng.normal(0, 5, n_samples)
+    missing = np.zeros(n_samples, dtype=bool)
+    for blink in rng.choice(np.arange(n_samples - 200), size=max(int(seconds / 20), 1), replace=False):
+        missing[blink : blink + 150] = True
+
+    # Triggers of every trial (see eyetracker.get_trigger), 4 s apart
+    triggers = []
+    for trial in range(n_trials):
+        onset = start_time + 1000 + trial * 4000
+        condition = rng.integers(1, 9)
+        for frame, delay in ((1, 0), (2, 1000), (3, 2000), (4, 3250)):
+            triggers.append((onset + delay, f"trig{frame}{condition}"))
+
+    with open(path, "w") as file:
+        file.write("** CONVERTED FROM synthetic.edf\n** TYPE: EDF_FILE BINARY EVENT SAMPLE TAGGED\n\n")
+        file.write(f"START\t{start_time} \tRIGHT\tSAMPLES\tEVENTS\n")
+        file.write(f"SAMPLES\tGAZE\tRIGHT\tRATE\t{rate:.2f}\tTRACKING\tCR\tFILTER\t2\n")
+
+        trigger_index = 0
+        for index in range(n_samples):
+            while trigger_index < len(triggers) and triggers[trigger_index][0] <= times[index]:
+                file.write(f"MSG\t{triggers[trigger_index][0]} {triggers[trigger_index][1]}\n")
+                trigger_index += 1
+
+            if missing[index]:
+                file.write(f"{times[index]}\t   .\t   .\t    0.0\t...\n")
+            else:
+                x, y = position[index]
+                file.write(f"{times[index]}\t {x:7.1f}\t {y:7.1f}\t {pupil[index]:7.1f}\t...\n")
+
+        # Blinks can overlap, so the events are made from the missing stretches
+        edges = np.diff(np.r_[0, missing.astype(int), 0])
+        for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+            file.write(f"EBLINK R {times[start]}\t{times[end - 1]}\t{times[end - 1] - times[start] + 1}\n")
+        file.write(f"END\t{times[-1]} \tSAMPLES\tEVENTS\tRES\t 38.0\t 38.0\n")
+
+    return times[onsets], displacements
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*", help=".asc files to parse")
+    parser.add_argument("--out", default="parsed", help="where to save the parsed data")
+    parser.add_argument("--processes", type=int, help="how many files to parse at once")
+    parser.add_argument("--synthetic", help="write a synthetic .asc file here instead")
+    parser.add_argument("--seconds", type=float, default=60, help="length of the synthetic recording")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        onsets, _ = write_synthetic_asc(args.synthetic, args.seconds)
+        print(f"Wrote {args.synthetic} with {len(onsets)} microsaccades")
+
+    for prefix in parse_files(args.files, args.out, args.processes) if args.files else []:
+        samples = load_samples(prefix)
+        events = load_events(prefix)
+        print(
+            f"{prefix}: {len(samples)} samples, {len(events['triggers'])} triggers, "
+            + ", ".join(f"{len(events[name])} {name}" for name in EVENTS)
+        )
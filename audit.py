@@ -0,0 +1,155 @@
+"""
+This script checks the timing that was actually achieved during sessions,
+from the triggers in the eyetracking data: the time from the first to the second stimulus
+and from the second stimulus to the cue, for every trial.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+usage:
+
+    python audit.py 12_3456.asc 13_3457.asc [--tolerance 5] [--out intervals.csv]
+
+Takes .asc files (the .edf converted with edf2asc) or trigger journals (_triggers.bin, see journal.py).
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import re
+
+import numpy as np
+
+from schedule import STIMULUS_DURATION, GAP_DURATION
+
+# The first digit of a trigger code is the frame (see eyetracker.get_trigger)
+FRAMES = {"stimulus_1": 1, "stimulus_2": 2, "cue": 3}
+
+# Interval: (from frame, to frame, what it should be in ms)
+INTERVALS = {
+    "stimulus_1_to_stimulus_2": ("stimulus_1", "stimulus_2", (STIMULUS_DURATION + GAP_DURATION) * 1000),
+    "stimulus_2_to_cue": ("stimulus_2", "cue", (STIMULUS_DURATION + GAP_DURATION) * 1000),
+}
+
+# e.g. 'MSG	1234567 trig11', or 'MSG	1234567 12 trig11' for a message sent 12 ms earlier
+TRIGGER_MESSAGE = re.compile(r"^MSG\s+(\d+(?:\.\d+)?)\s+(?:(-?\d+)\s+)?trig(\d+)\s*$")
+
+
+def read_triggers(path):
+    """Returns the time (in ms, tracker clock) and code of every trigger in an .asc file or trigger journal."""
+    if path.endswith(".bin"):
+        from journal import read_journal, tracker_times
+
+        journal = read_journal(path)
+        triggers = journal["code"] >= 0
+        return tracker_times(journal)[triggers], np.array(journal["code"][triggers])
+
+    times = []
+    codes = []
+    with open(path, errors="replace") as file:
+        for line in file:
+            if not line.startswith("MSG"):
+                continue
+            match = TRIGGER_MESSAGE.match(line)
+            if match:
+                time, offset, code = match.groups()
+                times.append(float(time) - float(offset or 0))
+                codes.append(code)
+
+    return np.array(times), np.array(codes, dtype=np.int64)
+
+
+def trial_intervals(sessions):
+    """
+    Pairs the triggers of all `sessions` ({name: (times, codes)}) by trial, all at once:
+    every first-stimulus trigger starts a trial, and the trial's other triggers should have
+    the same condition (the digits after the frame). Returns a dict of columns, one row per trial.
+    """
+    names = list(sessions)
+    times = np.concatenate([sessions[name][0] for name in names])
+    codes = np.concatenate([sessions[name][1] for name in names])
+    session = np.repeat(np.arange(len(names)), [len(sessions[name][1]) for name in names])
+
+    # Split every code in its frame (first digit) and condition (the rest)
+    digits = np.floor(np.log10(np.maximum(codes, 1))).astype(np.int64)
+    frame = codes // 10**digits
+    condition = codes % 10**digits
+
+    # Every trigger belongs to the trial of the last first-stimulus trigger before it (in its session)
+    starts = (frame == FRAMES["stimulus_1"]) | np.r_[True, session[1:] != session[:-1]]
+    trial = np.cumsum(starts) - 1
+    n_trials = trial[-1] + 1 if len(trial) else 0
+
+    first = {}
+    for name, wanted in FRAMES.items():
+        mask = frame == wanted
+        first[name] = np.full(n_trials, np.nan)
+        first[f"{name}_condition"] = np.full(n_trials, -1)
+        # Reversed, so the first trigger of a trial is the one that's kept
+        first[name][trial[mask][::-1]] = times[mask][::-1]
+        first[f"{name}_condition"][trial[mask][::-1]] = condition[mask][::-1]
+
+    session_of_trial = np.zeros(n_trials, dtype=np.int64)
+    session_of_trial[trial] = session
+    trial_in_session = np.arange(n_trials) - np.searchsorted(session_of_trial, session_of_trial)
+
+    consistent = (first["stimulus_1_condition"] == first["stimulus_2_condition"]) & (
+        first["stimulus_1_condition"] == first["cue_condition"]
+    )
+    columns = {
+        "session": np.array(names, dtype=object)[session_of_trial],
+        "trial": trial_in_session + 1,
+        "condition": first["stimulus_1_condition"],
+        "consistent": consistent,
+    }
+    for interval, (start, end, _) in INTERVALS.items():
+        columns[interval] = np.where(consistent, first[end] - first[start], np.nan)
+
+    return columns
+
+
+def report(columns, tolerance):
+    """Prints the distribution of every interval and the trials that are off by more than `tolerance` ms."""
+    outliers = []
+    print(f"{len(columns['trial'])} trials, {np.sum(~columns['consistent'])} with missing or mismatched triggers")
+
+    for interval, (_, _, nominal) in INTERVALS.items():
+        achieved = columns[interval]
+        valid = achieved[~np.isnan(achieved)]
+        if not len(valid):
+            print(f"{interval}: no trials")
+            continue
+
+        error = valid - nominal
+        print(
+            f"{interval} (should be {nominal:.0f} ms): mean {valid.mean():.2f}, sd {valid.std():.2f}, "
+            f"percentiles 1/50/99 {np.percentile(valid, 1):.1f}/{np.median(valid):.1f}/"
+            f"{np.percentile(valid, 99):.1f}, min {valid.min():.1f}, max {valid.max():.1f} ms; "
+            f"{np.sum(np.abs(error) > tolerance)} outside ±{tolerance} ms"
+        )
+
+        for index in np.flatnonzero(np.abs(achieved - nominal) > tolerance):
+            outliers.append(
+                (columns["session"][index], columns["trial"][index], interval, achieved[index])
+            )
+
+    for session, trial, interval, achieved in outliers[:50]:
+        print(f"  {session} trial {trial}: {interval} {achieved:.1f} ms")
+    if len(outliers) > 50:
+        print(f"  ... and {len(outliers) - 50} more")
+
+    return outliers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+", help=".asc files or _triggers.bin journals")
+    parser.add_argument("--tolerance", type=float, default=5, help="in ms (default: 5)")
+    parser.add_argument("--out", help="save every trial's intervals to this .csv")
+    args = parser.parse_args()
+
+    columns = trial_intervals({path: read_triggers(path) for path in args.files})
+    report(columns, args.tolerance)
+
+    if args.out:
+        import pandas as pd
+
+        pd.DataFrame(columns).to_csv(args.out, index=False)
@@ -0,0 +1,208 @@
+"""
+This script times the parts of the experiment that run every frame or every trial,
+on a headless window (see headless.py), and compares them against a stored baseline.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+usage:
+
+    python benchmark.py run [--save]            # time everything, --save stores it as this machine's baseline
+    python benchmark.py compare [--threshold 0.2] [--only get_colour ...]
+
+Baselines are saved per machine in benchmarks/<machine>.json. `compare` exits with 1
+when a benchmark got slower than its baseline by more than the threshold (as a fraction).
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+from datetime import datetime
+
+BASELINE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+REPEATS = 7
+
+
+def prepare_benchmarks(settings):
+    """
+    Returns {name: function} of everything that is timed. Everything a function needs
+    (colour wheel, marker, conditions) is made here, so only the work itself is timed.
+    """
+    from block import create_trial_list
+    from eyetracker import get_trigger
+    from headless import VirtualClock, virtual_time
+    from response import (
+        INNER_RADIUS,
+        RADIUS,
+        draw_response_screen,
+        evaluate_response,
+        get_colour,
+        get_response,
+        make_marker,
+        move_marker,
+    )
+    from stimuli import create_colour_wheel, draw_fixation_dot
+    from trial import generate_trial_characteristics, single_trial
+
+    colours = settings["colours"]
+    colour_wheel = create_colour_wheel(90, settings)
+    marker = make_marker(RADIUS, INNER_RADIUS, settings)
+    marker.colorSpace = "hsv"
+    mouse_pos = (120.0, 80.0)
+    conditions = create_trial_list(48)[0]
+    characteristics = generate_trial_characteristics(conditions, settings)
+
+    def response_frame():
+        # One frame of the second get_response loop
+        draw_response_screen(colour_wheel, 1, 0, [], settings)
+        move_marker(marker, mouse_pos, 90, colours, RADIUS, INNER_RADIUS, settings)
+        settings["window"].flip()
+
+    def in_virtual_time(function, **kwargs):
+        # Waiting takes no time, so only drawing and computing is timed
+        def timed():
+            with virtual_time(VirtualClock()):
+                function(**kwargs)
+
+        return timed
+
+    return {
+        "draw_fixation_dot": lambda: draw_fixation_dot(settings),
+        "create_colour_wheel": lambda: create_colour_wheel(90, settings),
+        "get_colour": lambda: get_colour(mouse_pos, 90, colours),
+        "move_marker": lambda: move_marker(
+            marker, mouse_pos, 90, colours, RADIUS, INNER_RADIUS, settings
+        ),
+        "response_frame": response_frame,
+        "evaluate_response": lambda: evaluate_response(colours[10], colours[350], colours),
+        "get_trigger": lambda: get_trigger("response_onset", ["left", "right"], 2, 0),
+        "generate_trial_characteristics": lambda: generate_trial_characteristics(
+            conditions, settings
+        ),
+        "create_trial_list": lambda: create_trial_list(48),
+        "get_response": in_virtual_time(
+            get_response,
+            target_colour=characteristics["target_colour"],
+            positions=characteristics["positions"],
+            target_item=characteristics["target_item"],
+            retrocue=characteristics["retrocue"],
+            settings=settings,
+            testing=True,
+            eyetracker=None,
+        ),
+        "single_trial": in_virtual_time(
+            single_trial, **characteristics, settings=settings, testing=True
+        ),
+    }
+
+
+def run_benchmarks(benchmarks, only=None):
+    """Times every benchmark (autoranged to at least 0.2 s per repeat), in microseconds per call."""
+    results = {}
+
+    for name, function in benchmarks.items():
+        if only and name not in only:
+            continue
+
+        timer = timeit.Timer(function)
+        number, _ = timer.autorange()
+        per_call = [total / number * 1e6 for total in timer.repeat(REPEATS, number)]
+
+        results[name] = {
+            "median_us": statistics.median(per_call),
+            "min_us": min(per_call),
+            "calls": number * REPEATS,
+        }
+        print(f"{name:<32} {results[name]['median_us']:>12.2f} us  (min {results[name]['min_us']:.2f})")
+
+    return results
+
+
+def machine_name():
+    return platform.node() or "unknown"
+
+
+def baseline_path(machine=None):
+    return os.path.join(BASELINE_DIRECTORY, f"{machine or machine_name()}.json")
+
+
+def save_baseline(results, path, backend):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(
+            {
+                "machine": machine_name(),
+                "platform": platform.platform(),
+                "python": platform.python_version(),
+                "backend": backend,
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+
+
+def compare_results(baseline, results, threshold):
+    """Returns the benchmarks that are more than `threshold` (fraction) slower than the baseline."""
+    regressions = []
+
+    for name, result in results.items():
+        if name not in baseline["results"]:
+            print(f"{name:<32} (no baseline)")
+            continue
+
+        before = baseline["results"][name]["median_us"]
+        change = result["median_us"] / before - 1
+        regressed = change > threshold
+        print(
+            f"{name:<32} {before:>12.2f} -> {result['median_us']:>12.2f} us  "
+            f"{change:+7.1%}{'  REGRESSION' if regressed else ''}"
+        )
+
+        if regressed:
+            regressions.append({"name": name, "baseline_us": before, **result, "change": change})
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["run", "compare"])
+    parser.add_argument("--save", action="store_true", help="save the results as this machine's baseline")
+    parser.add_argument("--baseline", help=f"baseline file (default: {baseline_path()})")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown (default: 0.2)")
+    parser.add_argument("--only", nargs="+", help="only run these benchmarks")
+    parser.add_argument("--backend", default="offscreen", choices=["offscreen", "software", "hidden"])
+    args = parser.parse_args()
+
+    path = args.baseline or baseline_path()
+    if args.command == "compare" and not os.path.exists(path):
+        sys.exit(f"No baseline at {path}, make one with: python benchmark.py run --save")
+
+    from set_up import get_monitor_and_dir, get_settings
+
+    monitor, directory = get_monitor_and_dir(False)
+    settings = get_settings(monitor, directory, backend=args.backend)
+
+    try:
+        results = run_benchmarks(prepare_benchmarks(settings), args.only)
+    finally:
+        settings["window"].close()
+
+    if args.save:
+        save_baseline(results, path, args.backend)
+        print(f"Saved baseline to {path}")
+
+    if args.command == "compare":
+        with open(path) as file:
+            baseline = json.load(file)
+
+        print(f"\nCompared to {path} ({baseline['created']}):")
+        regressions = compare_results(baseline, results, args.threshold)
+        if regressions:
+            sys.exit(f"{len(regressions)} benchmark(s) more than {args.threshold:.0%} slower.")
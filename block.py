@@ -7,35 +7,22 @@ made by Anna van Harmelen, 2025
 """
 
 import random
+from time import sleep
 from stimuli import show_text
 from response import wait_for_key
+from schedule import balanced_trials
+from tracing import traced
 
 
 def create_trial_list(n_trials):
-    if n_trials % 24 != 0:
-        raise Exception(
-            "Expected number of trials to be divisible by 24, otherwise perfect factorial combinations are not possible."
-        )
-
-    # Generate equal distribution of target items
-    target_item = n_trials // 2 * [1, 2]
-
-    # Generate equal distribution of stimulus 1 locations
-    loc_1 = n_trials // 8 * (n_trials // 6 * ["left"] + n_trials // 6 * ["right"])
-
-    # Generate equal distribution of stimulus 2 locations
-    loc_2 = n_trials // 4 * (n_trials // 12 * ["left"] + n_trials // 12 * ["right"])
-
-    # Generate equal distribution of trials with an informative retrocue
-    informative_cue = n_trials // 3 * [True] + n_trials // 3 * [True] + n_trials // 3 * [False]
-
     # Create trial parameters for all trials
-    trials = list(zip(target_item, informative_cue, loc_1, loc_2))
+    trials = balanced_trials(n_trials)
     random.shuffle(trials)
 
     return trials
 
 
+@traced("break screen")
 def block_break(current_block, n_blocks, avg_score, settings, eyetracker):
     blocks_left = n_blocks - current_block
 
@@ -64,6 +51,7 @@ def block_break(current_block, n_blocks, avg_score, settings, eyetracker):
     return False
 
 
+@traced("break screen")
 def long_break(n_blocks, avg_score, settings, eyetracker):
     show_text(
         f"You scored {avg_score}% correct on the previous block. "
@@ -88,6 +76,7 @@ def long_break(n_blocks, avg_score, settings, eyetracker):
     return False
 
 
+@traced("finish screen")
 def finish(n_blocks, settings):
     show_text(
         f"Congratulations! You successfully finished all {n_blocks} blocks!"
@@ -99,6 +88,7 @@ def finish(n_blocks, settings):
     wait_for_key(["space"], settings["keyboard"])
 
 
+@traced("finish screen")
 def quick_finish(settings):
     settings["window"].flip()
     show_text(
@@ -108,3 +98,28 @@ def quick_finish(settings):
     settings["window"].flip()
 
     wait_for_key(["space"], settings["keyboard"])
+
+
+def wait_for_transfer(transfer, settings):
+    # Nothing to wait for when there was no (real) eyetracker
+    if transfer is None:
+        return
+
+    while not transfer.done:
+        show_text(
+            "Saving eyetracking data, please wait..."
+            f"\n\n{transfer.bytes_received / 1e6:.1f} MB received ({transfer.status})",
+            settings["window"],
+        )
+        settings["window"].flip()
+        sleep(0.2)
+
+    transfer.join()
+
+    if transfer.status == "failed":
+        print(
+            f"WARNING: eyetracking data could not be transferred to {transfer.target}: {transfer.error}"
+            "\nThe file is still on the eyetracker computer."
+        )
+    else:
+        print(f"Transferred {transfer.target} ({transfer.size} bytes, sha256 {transfer.checksum})")
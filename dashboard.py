@@ -0,0 +1,247 @@
+"""
+This file contains the functions necessary for
+showing the experimenter how the session is going, in a browser (http://localhost:8050).
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+The experiment only collects updates in a list (see Dashboard.post), and hands them over
+in one go between trials (Dashboard.flush). Everything else (keeping the totals, serving
+the page and pushing updates to the browser) happens on background threads.
+
+made by Anna van Harmelen, 2025
+"""
+
+import http.server
+import json
+import queue
+import threading
+from collections import deque
+from statistics import median
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Session dashboard</title>
+<style>
+  body { font-family: sans-serif; background: #222; color: #eee; margin: 2em; }
+  table { border-collapse: collapse; margin-bottom: 1.5em; }
+  td, th { padding: 0.2em 1em; text-align: left; border-bottom: 1px solid #444; }
+  .warning { color: #f84; }
+</style>
+</head>
+<body>
+<h1 id="title">Waiting for the session to start...</h1>
+<table id="overview"></table>
+<h2>Accuracy per condition</h2>
+<table id="conditions"></table>
+<h2>Blocks</h2>
+<table id="blocks"></table>
+<script>
+function rows(table, items) {
+  document.getElementById(table).innerHTML = items
+    .map(([name, value, warning]) =>
+      `<tr><th>${name}</th><td class="${warning ? "warning" : ""}">${value}</td></tr>`)
+    .join("");
+}
+new EventSource("/events").onmessage = (message) => {
+  const state = JSON.parse(message.data);
+  const session = state.session;
+  document.getElementById("title").textContent =
+    `Session ${session.session_number}, participant ${session.participant_number}`;
+  rows("overview", [
+    ["Status", state.status],
+    ["Progress", `trial ${state.trials_done} of ${session.total_trials}, block ${state.block}`],
+    ["Median response time (last 50)", `${state.median_response_time_in_ms} ms`],
+    ["Dropped frames (last trial / total)", `${state.last_frame_drops} / ${state.frame_drops}`,
+     state.last_frame_drops > 0],
+    ["Eyetracker", state.tracker, state.tracker !== "ok"],
+  ]);
+  rows("conditions", Object.entries(state.conditions).map(([name, c]) =>
+    [name, `${c.mean_performance.toFixed(1)}% (${c.n} trials)`]));
+  rows("blocks", state.blocks.map((score, index) => [`Block ${index + 1}`, `${score}%`]));
+};
+</script>
+</body>
+</html>
+"""
+
+
+class Dashboard:
+    """
+    usage:
+
+        dashboard = Dashboard(port)
+        dashboard.start()
+        dashboard.post({"type": "trial", ...})   # during a trial: only appends to a list
+        dashboard.flush()                        # between trials: hands the updates over
+        dashboard.stop()
+
+    Update types: "session" (participant_number, session_number, total_trials),
+    "trial" (a trial record, plus frame_drops and tracker), "block" (block, avg_score)
+    and "status" (message).
+    """
+
+    def __init__(self, port=8050):
+        self.port = port
+        self.pending = []
+        self.updates = queue.SimpleQueue()
+        self.changed = threading.Condition()
+        self.version = 0
+        self.running = True
+        self.server = None
+        self.state = {
+            "session": {},
+            "status": "starting",
+            "trials_done": 0,
+            "block": None,
+            "conditions": {},
+            "blocks": [],
+            "median_response_time_in_ms": None,
+            "frame_drops": 0,
+            "last_frame_drops": 0,
+            "tracker": "ok",
+        }
+        self.response_times = deque(maxlen=50)
+
+    def start(self):
+        handler = type("Handler", (DashboardHandler,), {"dashboard": self})
+        try:
+            self.server = http.server.ThreadingHTTPServer(("127.0.0.1", self.port), handler)
+        except OSError as e:
+            print(f"WARNING: could not start the dashboard on port {self.port} ({e}).")
+            return False
+
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="dashboard", daemon=True).start()
+        threading.Thread(target=self.apply_updates, name="dashboard updates", daemon=True).start()
+        print(f"Dashboard on http://localhost:{self.port}")
+
+        return True
+
+    def post(self, update):
+        self.pending.append(update)
+
+    def flush(self):
+        if self.pending:
+            self.updates.put(self.pending)
+            self.pending = []
+
+    def stop(self):
+        self.flush()
+        self.updates.put(None)
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def apply_updates(self):
+        while True:
+            batch = self.updates.get()
+            if batch is None:
+                break
+
+            with self.changed:
+                for update in batch:
+                    self.apply(update)
+                self.version += 1
+                self.changed.notify_all()
+
+        with self.changed:
+            self.running = False
+            self.changed.notify_all()
+
+    def apply(self, update):
+        state = self.state
+
+        if update["type"] == "session":
+            state["session"] = {key: value for key, value in update.items() if key != "type"}
+            state["status"] = "running"
+
+        elif update["type"] == "trial":
+            state["status"] = "running"
+            state["trials_done"] = update["trial_number"]
+            state["block"] = update["block"]
+
+            condition = (
+                f"{'informative' if update['retrocue'] else 'neutral'} cue, "
+                f"item {update['target_item']} ({update['target_position']})"
+            )
+            totals = state["conditions"].setdefault(condition, {"n": 0, "mean_performance": 0.0})
+            totals["n"] += 1
+            totals["mean_performance"] += (update["performance"] - totals["mean_performance"]) / totals["n"]
+
+            self.response_times.append(update["response_time_in_ms"])
+            state["median_response_time_in_ms"] = round(median(self.response_times))
+            state["last_frame_drops"] = update.get("frame_drops", 0)
+            state["frame_drops"] += state["last_frame_drops"]
+            state["tracker"] = update.get("tracker", state["tracker"])
+
+        elif update["type"] == "block":
+            state["blocks"].append(update["avg_score"])
+
+        elif update["type"] == "status":
+            state["status"] = update["message"]
+
+    def wait_for_change(self, version, timeout=15):
+        """Returns the state (as json) once it is newer than `version`, or after `timeout`."""
+        with self.changed:
+            self.changed.wait_for(
+                lambda: self.version != version or not self.running, timeout
+            )
+            return self.version, json.dumps(self.state)
+
+
+class DashboardHandler(http.server.BaseHTTPRequestHandler):
+    dashboard = None
+
+    def do_GET(self):
+        if self.path == "/":
+            body = PAGE.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        elif self.path == "/state":
+            _, state = self.dashboard.wait_for_change(None, timeout=0)
+            body = state.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        elif self.path == "/events":
+            # Server-sent events: the whole state, every time it changes
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            version = None
+            try:
+                while self.dashboard.running:
+                    version, state = self.dashboard.wait_for_change(version)
+                    self.wfile.write(f"data: {state}\n\n".encode())
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        # Don't print every request in the experiment's console
+        pass
+
+
+def frame_drops(window, hz):
+    """
+    Counts the frames since the last call that took over 1.5 refreshes. Only the response
+    screens record their frame intervals (with settings["count_frame_drops"], see response.py):
+    the other screens are held on purpose, so their intervals aren't drops.
+    """
+    intervals = window.frameIntervals
+    window.frameIntervals = []
+
+    return sum(interval > 1.5 / hz for interval in intervals)
@@ -0,0 +1,107 @@
+"""
+This file contains the functions necessary for
+streaming trial data to disk while the experiment is running.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import json
+import os
+import queue
+import threading
+
+
+class TrialLog(threading.Thread):
+    """
+    Append-only log of trial records (one JSON object per line).
+
+    usage:
+
+        trial_log = TrialLog(path)
+        trial_log.append(record)   # after every trial, returns immediately
+        trial_log.sync()           # during the ITI, makes everything so far crash-safe
+        trial_log.sync(wait=True)  # at a break, waits until that's done
+        trial_log.close()          # at the end (waits as well)
+
+    Records are written by a background thread. They are only forced to disk
+    (fsync) when `sync()` is called, so all records since the last sync are
+    flushed in one go at a moment when timing doesn't matter.
+    """
+
+    def __init__(self, path):
+        super().__init__(daemon=True)
+        self.path = path
+        self.queue = queue.Queue()
+        self.start()
+
+    def append(self, record: dict):
+        self.queue.put(("record", record))
+
+    def sync(self, wait=False):
+        """Forces everything appended so far to disk, with `wait` returns once that's done."""
+        synced = threading.Event()
+        self.queue.put(("sync", synced))
+        if wait:
+            synced.wait()
+
+    def close(self):
+        self.sync(wait=True)
+        self.queue.put(("close", None))
+        self.join()
+
+    def run(self):
+        # When continuing a session that crashed, new records mustn't end up on its half-written last line
+        drop_torn_line(self.path)
+
+        with open(self.path, "a", encoding="utf-8") as file:
+            while True:
+                kind, record = self.queue.get()
+
+                if kind == "record":
+                    file.write(json.dumps(record, default=str) + "\n")
+                elif kind == "sync":
+                    file.flush()
+                    os.fsync(file.fileno())
+                    record.set()
+
+                else:
+                    return
+
+
+def drop_torn_line(path, chunk_size=1 << 16):
+    """Cuts the log back to its last complete line (a crash can leave half a record at the end)."""
+    if not os.path.exists(path):
+        return
+
+    with open(path, "r+b") as file:
+        end = file.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(position - chunk_size, 0)
+            file.seek(start)
+            newline = file.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+
+        if position != end:
+            file.truncate(position)
+
+
+def read_trial_log(path):
+    """Returns all complete records in the log (half-written lines are skipped)."""
+    records = []
+
+    if not os.path.exists(path):
+        return records
+
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+    return records
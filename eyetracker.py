@@ -6,8 +6,32 @@ To run the 'microsaccade bias temporal separation' experiment, see main.py.
 made by Anna van Harmelen, 2023, using code by Ezra Nasrawi & Baiwei Liu
 """
 
-from lib import eyelinker
+from time import sleep, time
+import hashlib
+import json
 import os
+import threading
+from tracing import span
+from journal import TriggerJournal
+
+
+def load_eyelinker():
+    # pylink (and everything it needs) is slow to import, and not needed when testing
+    from lib import eyelinker
+
+    return eyelinker
+
+
+def connect_to_tracker():
+    """
+    Connects to the tracker, returns the pylink.EyeLink (or None if that fails).
+    This is slow, so it can run while the window is being created.
+    """
+    try:
+        return load_eyelinker().pl.EyeLink()
+    except RuntimeError as e:
+        print(f"Could not connect to the eyetracker: {e}")
+        return None
 
 
 class Eyelinker:
@@ -20,32 +44,649 @@ class Eyelinker:
 
        eyelinker = Eyelinker(participant, session, window, directory)
        eyelinker.calibrate()
+
+    With `segmented=True` a new .edf file is used for every stretch between breaks:
+    call `end_segment(block)` before a break and `start()` after it. Every closed
+    segment is transferred in the background and listed in a manifest
+    (`<session>_<participant>_segments.json`) to stitch the recording back together.
     """
 
-    def __init__(self, participant, session, window, directory) -> None:
+    def __init__(
+        self,
+        participant,
+        session,
+        window,
+        directory,
+        segmented=False,
+        resume_block=None,
+        connection=None,
+    ) -> None:
         """
-        This also connects to the tracker
+        This also connects to the tracker.
+        With `resume_block` (after a crash) recording continues in a new segment, after the
+        ones already made for this session, so nothing recorded before is overwritten.
+        Pass a `connection` from connect_to_tracker() to skip connecting (again).
         """
         self.directory = directory
         self.window = window
-        self.tracker = eyelinker.EyeLinker(
-            window=window, eye="RIGHT", filename=f"{session}_{participant}.edf"
+        self.participant = participant
+        self.session = session
+        self.segmented = segmented or resume_block is not None
+        self.segments = [] if resume_block is None else self._previous_segments()
+        self.transfer = None
+        self.recording = False
+
+        if self.segmented:
+            filename, _ = segment_filenames(
+                session, participant, len(self.segments) + 1
+            )
+        else:
+            filename = f"{session}_{participant}.edf"
+
+        self.tracker = load_eyelinker().EyeLinker(
+            window=window, eye="RIGHT", filename=filename, connection=connection
         )
         self.tracker.init_tracker()
 
+        # Keep a local copy of every message (see journal.py)
+        self.journal = None
+        if not self.tracker.mock:
+            self.journal = TriggerJournal(
+                os.path.join(directory, f"{session}_{participant}_triggers.bin")
+            )
+            self.journal.start()
+
+        # Keep the experiment going when the link drops
+        # and keep track of samples that don't make it over the link
+        self.sample_monitor = None
+        if not self.tracker.mock:
+            self.tracker = LinkSupervisor(self.tracker, journal=self.journal)
+            self.sample_monitor = SampleMonitor(self.tracker)
+            self.sample_monitor.start()
+
+        if self.segmented:
+            self._open_segment(len(self.segments) + 1, resume_block, open_file=False)
+
     def start(self):
+        if self.recording:
+            return
+
+        # A closed segment means a new file has to be opened first
+        if self.segmented and self.segments[-1]["last_block"] is not None:
+            self._open_segment(len(self.segments) + 1)
+
         self.tracker.start_recording()
+        self.recording = True
+
+        # (Re)measure the offset between the local and the tracker's clock
+        if self.journal:
+            self.journal.synchronise(self._tracker_time)
 
     def calibrate(self):
+        # The link can't be used for calibrating while a file is coming in
+        self._wait_for_transfer()
+
         self.tracker.calibrate()
+        self.recording = False
 
-    def stop(self):
-        os.chdir(self.directory)
+    def recover(self, new_block=False):
+        """
+        Try to restore a lost link to the tracker. Call this only at moments where a short
+        delay doesn't matter (before a trial's ITI, during breaks).
+        """
+        if isinstance(self.tracker, LinkSupervisor):
+            self.tracker.recover(new_block, restart_recording=self.recording)
+
+    def start_trial(self):
+        if self.sample_monitor:
+            self.sample_monitor.reset()
+
+    def end_trial(self, trial_number):
+        """
+        Returns this trial's link sample counts (to save with the trial data)
+        and shows them on the host PC.
+        """
+        if not self.sample_monitor:
+            return {}
+
+        counts = self.sample_monitor.read()
+        self.tracker.send_status(
+            f"Trial {trial_number} | samples {counts['link_samples']} | "
+            f"gaps {counts['link_gaps']} | dropped {counts['link_dropped_samples']} | "
+            f"longest {counts['link_longest_gap_ms']} ms"
+        )
+
+        return counts
+
+    def end_segment(self, last_block):
+        """
+        Closes the current .edf segment (ending with block `last_block`)
+        and starts transferring it in the background.
+        """
+        segment = self.segments[-1]
+        if segment["last_block"] is not None:
+            # Already closed, e.g. when stopping during a break
+            return self.transfer
 
         self.tracker.stop_recording()
-        self.tracker.transfer_edf()
+        self.recording = False
         self.tracker.close_edf()
 
+        segment["last_block"] = last_block
+        segment["tracker_time_end"] = self._tracker_time()
+
+        if not self.tracker.mock:
+            self.transfer = EdfTransfer(
+                self.tracker, os.path.join(self.directory, segment["local_file"])
+            )
+            self.transfer.start()
+
+        self.write_manifest()
+
+        return self.transfer
+
+    def stop(self, last_block=None):
+        """
+        Stops recording and starts transferring the .edf file in the background.
+        Returns the running EdfTransfer (or None when using the mock tracker).
+        """
+        if self.sample_monitor:
+            self.sample_monitor.stop()
+
+        if self.journal:
+            self.journal.close()
+
+        if isinstance(self.tracker, LinkSupervisor):
+            self.tracker.write_outages(
+                os.path.join(
+                    self.directory,
+                    f"{self.session}_{self.participant}_link_outages.json",
+                )
+            )
+
+        if self.segmented:
+            return self.end_segment(last_block)
+
+        self.tracker.stop_recording()
+        self.recording = False
+        self.tracker.close_edf()
+
+        if self.tracker.mock:
+            return None
+
+        transfer = EdfTransfer(
+            self.tracker, os.path.join(self.directory, self.tracker.edf_filename)
+        )
+        transfer.start()
+
+        return transfer
+
+    def _manifest_path(self):
+        return os.path.join(
+            self.directory, f"{self.session}_{self.participant}_segments.json"
+        )
+
+    def _previous_segments(self):
+        # Without a manifest, the crashed run recorded everything in one file
+        if not os.path.exists(self._manifest_path()):
+            return [
+                {
+                    "index": 1,
+                    "tracker_file": f"{self.session}_{self.participant}.edf",
+                    "local_file": f"{self.session}_{self.participant}.edf",
+                    "first_block": 1,
+                    "last_block": None,
+                    "tracker_time_start": None,
+                    "tracker_time_end": None,
+                    "local_time_start": None,
+                }
+            ]
+
+        with open(self._manifest_path()) as file:
+            segments = json.load(file)["segments"]
+
+        for segment in segments:
+            if not os.path.exists(os.path.join(self.directory, segment["local_file"])):
+                print(
+                    f"WARNING: {segment['tracker_file']} is not on this computer yet, "
+                    "get it from the eyetracker computer."
+                )
+
+        return segments
+
+    def write_manifest(self):
+        if not self.segmented:
+            return
+
+        # Fill in the results of any finished transfers
+        for segment in self.segments:
+            path = os.path.join(self.directory, segment["local_file"])
+            checksum_file = path + ".sha256"
+            if os.path.exists(checksum_file):
+                with open(checksum_file) as file:
+                    segment["sha256"] = file.read().split()[0]
+                segment["size"] = os.path.getsize(path)
+
+        manifest = {
+            "participant": int(self.participant),
+            "session": int(self.session),
+            "clock": "tracker time in ms, shared by all segments of this session",
+            "segments": self.segments,
+        }
+
+        with open(self._manifest_path(), "w") as file:
+            json.dump(manifest, file, indent=2)
+
+    def _open_segment(self, index, first_block=None, open_file=True):
+        self._wait_for_transfer()
+
+        tracker_file, local_file = segment_filenames(
+            self.session, self.participant, index
+        )
+        if first_block is None:
+            first_block = self.segments[-1]["last_block"] + 1 if self.segments else 1
+
+        # A segment cut short by a crash ends in the block that is resumed
+        if self.segments and self.segments[-1]["last_block"] is None:
+            self.segments[-1]["last_block"] = first_block
+
+        # The first file of a run is already opened by init_tracker
+        if open_file:
+            self.tracker.edf_filename = tracker_file
+            self.tracker.open_edf()
+            self.tracker.initialize_tracker()
+
+        self.tracker.send_message(f"SEGMENT {index} FIRST_BLOCK {first_block}")
+
+        self.segments.append(
+            {
+                "index": index,
+                "tracker_file": tracker_file,
+                "local_file": local_file,
+                "first_block": first_block,
+                "last_block": None,
+                "tracker_time_start": self._tracker_time(),
+                "tracker_time_end": None,
+                "local_time_start": time(),
+            }
+        )
+
+    def _wait_for_transfer(self):
+        if self.transfer is not None:
+            self.transfer.join()
+            self.write_manifest()
+            self.transfer = None
+
+    def _tracker_time(self):
+        if self.tracker.mock:
+            return None
+        try:
+            with self.tracker.lock:
+                return self.tracker.tracker.trackerTime()
+        except RuntimeError:
+            return None
+
+
+class LinkSupervisor:
+    """
+    Wraps a ConnectedEyeLinker so that a lost link doesn't end the session.
+
+    Everything is passed on to the wrapped tracker, but when the link drops
+    (a call raises, or the tracker reports being disconnected), messages are
+    buffered with their local timestamp instead. `recover()` then reconnects with
+    an increasing delay between attempts, restarts recording and replays the buffered
+    messages with their offset in ms (EyeLink's '<offset> <message>' convention), so
+    they end up at the right time in the .edf file. After `max_attempts` failed attempts
+    it behaves like the mock tracker until the next block.
+    Every outage is kept in `outages`.
+    """
+
+    # Calls that need the link, other attributes are simply passed on
+    _guarded = (
+        "send_message",
+        "send_command",
+        "send_status",
+        "start_recording",
+        "stop_recording",
+        "open_edf",
+        "close_edf",
+    )
+
+    def __init__(self, linker, max_attempts=3, backoff=0.5, sample_rate=1000, journal=None):
+        self.linker = linker
+        self.journal = journal
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.sample_rate = sample_rate
+
+        self.lost = False
+        self.gave_up = False
+        self.attempts = 0
+        self.next_attempt = 0
+        self.buffer = []
+        self.outages = []
+
+        # pylink isn't thread-safe, so calls over the link take turns with the SampleMonitor
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.linker, name)
+
+        if name in self._guarded:
+            return lambda *args, **kwargs: self._guarded_call(
+                name, attribute, *args, **kwargs
+            )
+
+        return attribute
+
+    def __setattr__(self, name, value):
+        # Settings like edf_filename belong to the wrapped tracker
+        if name != "linker" and name not in self.__dict__ and hasattr(
+            self.linker, name
+        ):
+            setattr(self.linker, name, value)
+        else:
+            super().__setattr__(name, value)
+
+    def _guarded_call(self, name, function, *args, **kwargs):
+        # Every message is also kept locally, even when it can't be sent
+        if name == "send_message" and self.journal:
+            self.journal.add(args[0])
+
+        if not self.lost:
+            try:
+                with self.lock, span(f"tracker {name}"):
+                    return function(*args, **kwargs)
+            except RuntimeError as e:
+                self._mark_lost(e)
+
+        if name == "send_message":
+            self.buffer.append((time(), args[0]))
+
+    def _mark_lost(self, reason):
+        print(f"WARNING: lost connection to the eyetracker ({reason}).")
+        self.lost = True
+        self.attempts = 0
+        self.next_attempt = 0
+        self.outages.append(
+            {
+                "lost_at": time(),
+                "reason": str(reason),
+                "recovered_at": None,
+                "time_to_recovery_s": None,
+                "estimated_lost_samples": None,
+                "messages_replayed": 0,
+                "attempts": 0,
+                "fell_back_to_mock": False,
+            }
+        )
+
+    def _connected(self):
+        try:
+            return self.linker.tracker.isConnected() == 1
+        except RuntimeError:
+            return False
+
+    def recover(self, new_block=False, restart_recording=True):
+        if not self.lost and not self._connected():
+            self._mark_lost("tracker reports no connection")
+
+        if not self.lost:
+            return
+
+        # Try again (from the start) once a new block has begun
+        if new_block:
+            self.gave_up = False
+            self.attempts = 0
+            self.next_attempt = 0
+
+        if self.gave_up or time() < self.next_attempt:
+            return
+
+        outage = self.outages[-1]
+        self.attempts += 1
+        outage["attempts"] += 1
+
+        try:
+            self.linker.tracker = load_eyelinker().pl.EyeLink()
+            self.linker.initialize_graphics()
+            if restart_recording:
+                self.linker.start_recording()
+        except RuntimeError as e:
+            print(f"Reconnecting to the eyetracker failed (attempt {self.attempts}): {e}")
+            self.next_attempt = time() + self.backoff * 2 ** (self.attempts - 1)
+            if self.attempts >= self.max_attempts:
+                print("Continuing without eyetracker until the next block.")
+                self.gave_up = True
+                outage["fell_back_to_mock"] = True
+            return
+
+        # Put the buffered messages where they belong in time
+        now = time()
+        for sent_at, message in self.buffer:
+            self.linker.send_message(f"{round((now - sent_at) * 1000)} {message}")
+
+        outage["recovered_at"] = now
+        outage["time_to_recovery_s"] = now - outage["lost_at"]
+        outage["estimated_lost_samples"] = round(
+            outage["time_to_recovery_s"] * self.sample_rate
+        )
+        outage["messages_replayed"] = len(self.buffer)
+        print(
+            f"Reconnected to the eyetracker after {outage['time_to_recovery_s']:.1f} s, "
+            f"replayed {len(self.buffer)} messages."
+        )
+
+        self.buffer = []
+        self.lost = False
+        self.gave_up = False
+
+    def write_outages(self, path):
+        if not self.outages:
+            return
+
+        with open(path, "w") as file:
+            json.dump(self.outages, file, indent=2)
+
+
+class SampleMonitor(threading.Thread):
+    """
+    Reads the samples coming in over the link on a background thread and counts
+    the gaps in their timestamps, to see whether the link keeps up with the sample rate.
+    Samples are taken from the link queue in batches every `poll_interval` seconds,
+    and only while a trial is running, so this hardly costs anything.
+
+    usage (per trial):
+
+        monitor.reset()
+        ...
+        counts = monitor.read()
+    """
+
+    def __init__(self, tracker, sample_rate=1000, poll_interval=0.02):
+        super().__init__(daemon=True)
+        self.tracker = tracker
+        self.period = 1000 / sample_rate  # in ms
+        self.poll_interval = poll_interval
+
+        self.active = False
+        self.running = True
+        self.last_time = None
+        self.samples = 0
+        self.gaps = 0
+        self.dropped = 0
+        self.longest_gap = 0
+
+    def reset(self):
+        with self.tracker.lock:
+            self._drain(count=False)
+            self.last_time = None
+            self.samples = 0
+            self.gaps = 0
+            self.dropped = 0
+            self.longest_gap = 0
+            self.active = True
+
+    def read(self):
+        with self.tracker.lock:
+            self._drain()
+            self.active = False
+
+            return {
+                "link_samples": self.samples,
+                "link_gaps": self.gaps,
+                "link_dropped_samples": self.dropped,
+                "link_longest_gap_ms": self.longest_gap,
+            }
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        while self.running:
+            if self.active and not self.tracker.lost:
+                with self.tracker.lock:
+                    self._drain()
+            sleep(self.poll_interval)
+
+    def _drain(self, count=True):
+        try:
+            link = self.tracker.tracker
+            item = link.getNextData()
+            while item:
+                if item == load_eyelinker().pl.SAMPLE_TYPE:
+                    sample_time = link.getFloatData().getTime()
+                    if count:
+                        self._count(sample_time)
+                item = link.getNextData()
+        except RuntimeError:
+            # The LinkSupervisor notices this as well
+            pass
+
+    def _count(self, sample_time):
+        self.samples += 1
+
+        if self.last_time is not None:
+            interval = sample_time - self.last_time
+            if interval > 1.5 * self.period:
+                self.gaps += 1
+                self.dropped += round(interval / self.period) - 1
+                self.longest_gap = max(self.longest_gap, interval)
+
+        self.last_time = sample_time
+
+
+def segment_filenames(session, participant, index):
+    """
+    Returns the filename of segment `index` on the tracker and on this computer.
+    The tracker only accepts 8 characters before '.edf', so the tracker file
+    only holds the (unique) session number and the segment index, e.g. '0012s03.edf'.
+    """
+    tracker_file = f"{int(session):04d}s{int(index):02d}.edf"
+    if len(tracker_file) > 12:
+        raise ValueError(
+            f"Session {session} and segment {index} don't fit in an EDF filename."
+        )
+
+    return tracker_file, f"{session}_{participant}_segment{int(index):02d}.edf"
+
+
+class EdfTransfer(threading.Thread):
+    """
+    Copies the .edf file from the tracker to `target` on a background thread,
+    so the finish screen can be shown while the data is still coming in.
+
+    The file is first received as `<name>.part.edf`, then its size is checked
+    against what the tracker reported and a sha256 checksum is written next to it
+    (`<name>.edf.sha256`). Only then is it renamed to `target`. Failed attempts are
+    retried from scratch, since the tracker cannot resume a partial transfer.
+    If `target` already exists with a matching checksum file, nothing is copied again.
+    """
+
+    def __init__(self, tracker, target, retries=3, retry_delay=2.0):
+        super().__init__(daemon=True)
+        self.tracker = tracker
+        self.target = target
+        self.partial = os.path.splitext(target)[0] + ".part.edf"
+        self.checksum_file = target + ".sha256"
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        self.status = "waiting"
+        self.attempts = 0
+        self.size = None
+        self.checksum = None
+        self.error = None
+
+    @property
+    def bytes_received(self):
+        # receiveDataFile writes straight to disk, so follow the file as it grows
+        for path in (self.partial, self.target):
+            if os.path.exists(path):
+                return os.path.getsize(path)
+        return 0
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    def run(self):
+        if self._already_transferred():
+            self.status = "done"
+            return
+
+        while self.attempts < self.retries:
+            self.attempts += 1
+            self.status = f"transferring (attempt {self.attempts})"
+            try:
+                reported_size = self.tracker.transfer_edf(self.partial)
+
+                # Check integrity before putting the file in its final place
+                actual_size = os.path.getsize(self.partial)
+                if actual_size != reported_size:
+                    raise IOError(
+                        f"Expected {reported_size} bytes, but received {actual_size}."
+                    )
+                self.size = actual_size
+                self.checksum = file_checksum(self.partial)
+
+                os.replace(self.partial, self.target)
+                with open(self.checksum_file, "w") as file:
+                    file.write(f"{self.checksum}  {os.path.basename(self.target)}\n")
+
+                self.status = "done"
+                return
+
+            except Exception as e:
+                self.error = e
+                print(f"Transfer of {self.target} failed: {e.__class__.__name__}: {e}")
+                sleep(self.retry_delay * self.attempts)
+
+        self.status = "failed"
+
+    def _already_transferred(self):
+        if not (os.path.exists(self.target) and os.path.exists(self.checksum_file)):
+            return False
+
+        with open(self.checksum_file) as file:
+            expected = file.read().split()[0]
+
+        if file_checksum(self.target) != expected:
+            return False
+
+        self.size = os.path.getsize(self.target)
+        self.checksum = expected
+        return True
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    checksum = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            checksum.update(chunk)
+
+    return checksum.hexdigest()
+
 
 def get_trigger(frame, positions, target_item, retrocue):
     condition_marker = {1: 1, 2: 2}[target_item]
@@ -0,0 +1,195 @@
+"""
+This file contains the functions necessary for
+running the experiment without a screen, mouse or keyboard (e.g. for benchmarks and tests).
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import importlib
+import random
+from contextlib import contextmanager
+from time import perf_counter, sleep
+
+import numpy as np
+
+
+class FakeMouse:
+    """
+    Stands in for psychopy.event.Mouse. Where it is and whether it is pressed is
+    decided by `driver(mouse)`, which is called every time the mouse is read.
+    Without a driver it moves to a random spot on the colour wheel and clicks straight away.
+    """
+
+    def __init__(self, visible=True, win=None, driver=None, radius=200):
+        self.visible = visible
+        self.win = win
+        self.driver = driver
+        self.position = (0.0, 0.0)
+        self.pressed = [0, 0, 0]
+        self.moved = False
+
+        if driver is None:
+            angle = np.radians(random.uniform(0, 360))
+            self.position = (radius * np.cos(angle), radius * np.sin(angle))
+            self.pressed = [1, 0, 0]
+            self.moved = True
+
+    def update(self):
+        if self.driver:
+            self.driver(self)
+
+    def getPos(self):
+        self.update()
+        return self.position
+
+    def mouseMoved(self):
+        self.update()
+        return self.moved
+
+    def getPressed(self):
+        self.update()
+        return self.pressed
+
+    def setVisible(self, visible):
+        self.visible = visible
+
+
+class FakeKeyboard:
+    """
+    Stands in for psychopy's Keyboard (and event.waitKeys, see response.wait_for_key).
+    Keys to be pressed are queued with `press`. When waiting for a key that isn't queued,
+    `default_key` (e.g. 'space') is pressed, so nothing ever waits forever.
+    """
+
+    fake = True
+
+    class Clock:
+        def __init__(self):
+            self.start = perf_counter()
+
+        def reset(self):
+            self.start = perf_counter()
+
+        def getTime(self):
+            return perf_counter() - self.start
+
+    def __init__(self, default_key="space"):
+        self.clock = self.Clock()
+        self.default_key = default_key
+        self.queue = []
+
+    def press(self, *keys):
+        self.queue.extend(keys)
+
+    def getKeys(self, keyList=None, *args, **kwargs):
+        keys = [key for key in self.queue if keyList is None or key in keyList]
+        self.queue = [key for key in self.queue if key not in keys]
+        return keys
+
+    def waitKeys(self, keyList=None, *args, **kwargs):
+        keys = self.getKeys(keyList)
+        if keys:
+            return keys[:1]
+        return [self.default_key if keyList is None else keyList[0]]
+
+    def clearEvents(self, *args, **kwargs):
+        pass
+
+
+# Where the experiment gets its clock functions from, {module: {name: VirtualClock method}}
+CLOCK_FUNCTIONS = {
+    "trial": {"time": "time", "wait": "wait", "sleep": "wait"},
+    "response": {"time": "time"},
+    "block": {"sleep": "wait"},
+    "practice": {"sleep": "wait"},
+}
+
+
+class VirtualClock:
+    """Replaces time(), wait() and sleep(): waiting only moves the clock forward."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def wait(self, seconds, *args, **kwargs):
+        self.now += max(seconds, 0)
+
+
+@contextmanager
+def virtual_time(clock, functions=CLOCK_FUNCTIONS):
+    """
+    Swaps the clock functions of the experiment's modules (see CLOCK_FUNCTIONS)
+    for those of `clock` until the end of the with-block.
+    """
+    originals = []
+    for module_name, names in functions.items():
+        module = importlib.import_module(module_name)
+        for name, method in names.items():
+            originals.append((module, name, getattr(module, name)))
+            setattr(module, name, getattr(clock, method))
+
+    try:
+        yield clock
+    finally:
+        for module, name, original in originals:
+            setattr(module, name, original)
+
+
+def pace_flips(window, hz, wait=sleep, clock=perf_counter):
+    """
+    Makes `window.flip` behave as if the screen refreshes at `hz`: every flip waits
+    until the next (fake) refresh. Offscreen windows would otherwise flip instantly.
+    Pass a virtual clock's `wait` and `time` to make this take no real time.
+    """
+    flip = window.flip
+    frame = 1 / hz
+    start = clock()
+
+    def paced_flip(*args, **kwargs):
+        result = flip(*args, **kwargs)
+        since_start = clock() - start
+        # Count refreshes as whole numbers: when exactly at a refresh (give or take rounding
+        # errors) wait for the next one, instead of a wait too small to move the clock
+        refreshes = int(since_start / frame + 1e-6) + 1
+        wait(refreshes * frame - since_start)
+        return result
+
+    window.flip = paced_flip
+    window.fake_refresh_rate = hz
+
+    return window
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from set_up import BACKENDS, get_monitor_and_dir, get_settings
+    from schedule import generate_schedule, schedule_rows
+    from trial import schedule_characteristics, single_trial
+
+    # Runs a few trials without a screen, e.g. to check a machine can draw them
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=BACKENDS[1:], default="offscreen")
+    parser.add_argument("--hz", type=float, help="fake refresh rate (default: don't wait for flips)")
+    parser.add_argument("--trials", type=int, default=3)
+    args = parser.parse_args()
+
+    monitor, directory = get_monitor_and_dir(False)
+    settings = get_settings(monitor, directory, backend=args.backend, fake_hz=args.hz)
+    rows = schedule_rows(generate_schedule(1, 48, seed=0))
+
+    for row in rows[: args.trials]:
+        started = perf_counter()
+        report = single_trial(
+            **schedule_characteristics(row, settings), settings=settings, testing=True
+        )
+        print(
+            f"trial {row['trial_in_block']}: {perf_counter() - started:.3f} s, "
+            f"performance {report['performance']}"
+        )
+
+    settings["window"].close()
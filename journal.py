@@ -0,0 +1,140 @@
+"""
+This file contains the functions necessary for
+keeping a local copy of every message (trigger) sent to the eyetracker, in a small binary file,
+so trial timing can be found without the .edf file.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+usage:
+
+    from journal import read_journal
+
+    journal = read_journal("12_3456_triggers.bin")       # a numpy memmap, see JOURNAL_DTYPE
+    onsets = tracker_times(journal)[journal["code"] == 11]
+
+made by Anna van Harmelen, 2025
+"""
+
+import os
+import queue
+import threading
+from time import time
+
+import numpy as np
+
+# One fixed-size record per message:
+#  - local_time: time.time() when it was sent, in s
+#  - tracker_time: the estimated tracker time (as in the .edf) when it was sent, in ms, with the
+#    clock offset known at the time (NaN before the first synchronisation; use tracker_times)
+#  - code: the trigger code (see eyetracker.get_trigger), -1 for other messages, SYNC_CODE for
+#    a measurement of the clock offset (its tracker_time is the measured tracker time)
+#  - message: the first 16 characters of the message
+JOURNAL_DTYPE = np.dtype(
+    [("local_time", "<f8"), ("tracker_time", "<f8"), ("code", "<i4"), ("message", "S16")]
+)
+SYNC_CODE = -2
+
+
+class TriggerJournal(threading.Thread):
+    """
+    Appends a record (see JOURNAL_DTYPE) for every message to `path`. `add` only puts the
+    message in a queue, the file is written on this thread.
+
+    The tracker time is estimated from the offset between the local clock and the tracker's
+    clock, measured with `synchronise` (e.g. whenever recording starts). Every measurement is
+    journalled too, so tracker_times can redo the estimates with all of them afterwards.
+    """
+
+    def __init__(self, path):
+        super().__init__(name="trigger journal", daemon=True)
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.offset = np.nan  # tracker time - local time, in ms
+
+    def add(self, message):
+        self.queue.put((time(), message, trigger_code(message), self.offset))
+
+    def synchronise(self, tracker_time, samples=10):
+        """Measures the clock offset, with `tracker_time` a function returning the tracker's time in ms."""
+        offsets = []
+        for _ in range(samples):
+            before = time()
+            now = tracker_time()
+            after = time()
+            if now is not None:
+                # Assume the tracker read its clock halfway through the round trip
+                offsets.append(now - (before + after) / 2 * 1000)
+
+        if offsets:
+            self.offset = float(np.median(offsets))
+            self.queue.put((after, "sync", SYNC_CODE, self.offset))
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        with open(self.path, "ab") as file:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+
+                # Write everything that has come in since, in one go
+                items = [item]
+                while True:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                done = items[-1] is None
+                items = [item for item in items if item is not None]
+
+                file.write(self.records(items).tobytes())
+                file.flush()
+
+                if done:
+                    break
+
+    def records(self, items):
+        records = np.zeros(len(items), dtype=JOURNAL_DTYPE)
+        for index, (local_time, message, code, offset) in enumerate(items):
+            records[index] = (
+                local_time,
+                local_time * 1000 + offset,
+                code,
+                message.encode()[:16],
+            )
+
+        return records
+
+
+def trigger_code(message):
+    # Triggers are sent as 'trig<code>'
+    if message.startswith("trig") and message[4:].isdigit():
+        return int(message[4:])
+    return -1
+
+
+def read_journal(path):
+    """Returns the journal as a (read-only) numpy memmap of JOURNAL_DTYPE records."""
+    # A crash can leave half a record at the end
+    n_records = os.path.getsize(path) // JOURNAL_DTYPE.itemsize
+    if n_records == 0:
+        return np.zeros(0, dtype=JOURNAL_DTYPE)
+
+    return np.memmap(path, dtype=JOURNAL_DTYPE, mode="r", shape=(n_records,))
+
+
+def tracker_times(journal):
+    """
+    Estimates the tracker time (ms) of every record from all clock offset measurements in the
+    journal, interpolated in between (so drift is followed) and the nearest one before the first
+    and after the last. Without any measurement, the local time is used instead.
+    """
+    local_time = np.asarray(journal["local_time"])
+    syncs = journal[journal["code"] == SYNC_CODE]
+    if not len(syncs):
+        return local_time * 1000
+
+    offsets = np.asarray(syncs["tracker_time"]) - np.asarray(syncs["local_time"]) * 1000
+    return local_time * 1000 + np.interp(local_time, syncs["local_time"], offsets)
@@ -0,0 +1,141 @@
+"""
+This file contains the functions necessary for
+checking whether memory use (or the number of OpenGL textures and buffers) grows during a session.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import gc
+import json
+import os
+import tracemalloc
+from collections import Counter
+from time import time
+
+# Types of which a growing number points to stimuli that are never cleaned up
+STIMULUS_TYPES = ["ShapeStim", "Circle", "TextStim", "Rect", "Mouse", "CustomMouse"]
+
+
+class LeakMonitor:
+    """
+    Samples memory use at every break and writes the samples to `path` (one json per line):
+    the resident memory (RSS), the top allocation sites (tracemalloc), the number of Python
+    objects per type and the number of live OpenGL textures and buffers.
+
+    Prints a warning when, since the previous sample, RSS grew by more than `max_growth_mb`
+    or the number of textures/buffers by more than `max_gl_growth`.
+
+    Tracing allocations slows Python down a little, so this is only on with main.py --monitor-leaks.
+    """
+
+    def __init__(self, path, max_growth_mb=50, max_gl_growth=100, top=10):
+        self.path = path
+        self.max_growth_mb = max_growth_mb
+        self.max_gl_growth = max_gl_growth
+        self.top = top
+        self.previous = None
+        self.previous_snapshot = None
+
+        tracemalloc.start()
+
+    def sample(self, block):
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        object_counts = Counter(type(thing).__name__ for thing in gc.get_objects())
+
+        sample = {
+            "block": block,
+            "time": time(),
+            "rss_mb": resident_memory_mb(),
+            "traced_mb": tracemalloc.get_traced_memory()[0] / 1e6,
+            "top_allocations": [
+                {"site": str(stat.traceback), "size_kb": stat.size / 1e3, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[: self.top]
+            ],
+            "growing_allocations": [],
+            "objects": sum(object_counts.values()),
+            "stimulus_objects": {name: object_counts[name] for name in STIMULUS_TYPES},
+            "top_objects": dict(object_counts.most_common(self.top)),
+            **gl_objects(),
+        }
+
+        if self.previous_snapshot:
+            sample["growing_allocations"] = [
+                {"site": str(stat.traceback), "size_diff_kb": stat.size_diff / 1e3}
+                for stat in snapshot.compare_to(self.previous_snapshot, "lineno")[: self.top]
+                if stat.size_diff > 0
+            ]
+
+        if self.previous:
+            self.warn(self.previous, sample)
+
+        with open(self.path, "a") as file:
+            file.write(json.dumps(sample) + "\n")
+
+        self.previous = sample
+        self.previous_snapshot = snapshot
+
+        return sample
+
+    def warn(self, previous, sample):
+        warnings = []
+
+        if sample["rss_mb"] is not None and previous["rss_mb"] is not None:
+            growth = sample["rss_mb"] - previous["rss_mb"]
+            if growth > self.max_growth_mb:
+                warnings.append(f"memory use grew by {growth:.0f} MB")
+
+        for kind in ("gl_textures", "gl_buffers"):
+            if sample[kind] is not None and previous[kind] is not None:
+                growth = sample[kind] - previous[kind]
+                if growth > self.max_gl_growth:
+                    warnings.append(f"{growth} more OpenGL {kind[3:]}")
+
+        if warnings:
+            print(
+                f"WARNING: since block {previous['block']}, " + " and ".join(warnings) + ". "
+                f"Most growth at {sample['growing_allocations'][:1]}"
+            )
+
+    def stop(self):
+        tracemalloc.stop()
+
+
+def resident_memory_mb():
+    """The process's resident memory in MB (None if it can't be read here)."""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        pass
+
+    # Without psutil this only works on Linux
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def gl_objects(max_name=1 << 14):
+    """
+    Counts the live OpenGL textures and buffers of the current context, by checking
+    every name up to `max_name` (OpenGL hands them out counting up from 1).
+    """
+    try:
+        from pyglet import gl
+    except ImportError:
+        return {"gl_textures": None, "gl_buffers": None}
+
+    try:
+        return {
+            "gl_textures": sum(bool(gl.glIsTexture(name)) for name in range(1, max_name)),
+            "gl_buffers": sum(bool(gl.glIsBuffer(name)) for name in range(1, max_name)),
+        }
+    except Exception:
+        # No current context (e.g. the window is closed)
+        return {"gl_textures": None, "gl_buffers": None}
@@ -19,7 +19,6 @@ import PIL
 import pylink
 
 import psychopy.event
-import psychopy.sound
 import psychopy.tools
 import psychopy.visual
 
@@ -65,14 +64,16 @@ class PsychoPyCustomDisplay(pylink.EyeLinkCustomDisplay):
         else:
             self.text_color = (1, 1, 1)
 
-        self.beeps = {
-            pylink.CAL_TARG_BEEP: psychopy.sound.Sound(value='C', secs=0.2, octave=5),
-            pylink.DC_TARG_BEEP: psychopy.sound.Sound(value='C', secs=0.2, octave=5),
-            pylink.CAL_GOOD_BEEP: psychopy.sound.Sound(value='A', secs=0.2, octave=6),
-            pylink.DC_GOOD_BEEP: psychopy.sound.Sound(value='A', secs=0.2, octave=6),
-            pylink.CAL_ERR_BEEP: psychopy.sound.Sound(value='E', secs=0.5, octave=4),
-            pylink.DC_ERR_BEEP: psychopy.sound.Sound(value='E', secs=0.5, octave=4)
+        # Sounds are only loaded when they are first played (see play_beep)
+        self.beep_settings = {
+            pylink.CAL_TARG_BEEP: dict(value='C', secs=0.2, octave=5),
+            pylink.DC_TARG_BEEP: dict(value='C', secs=0.2, octave=5),
+            pylink.CAL_GOOD_BEEP: dict(value='A', secs=0.2, octave=6),
+            pylink.DC_GOOD_BEEP: dict(value='A', secs=0.2, octave=6),
+            pylink.CAL_ERR_BEEP: dict(value='E', secs=0.5, octave=4),
+            pylink.DC_ERR_BEEP: dict(value='E', secs=0.5, octave=4)
         }
+        self.beeps = {}
 
         self.colors = {
             pylink.CR_HAIR_COLOR: (1, 1, 1),
@@ -199,6 +200,11 @@ class PsychoPyCustomDisplay(pylink.EyeLinkCustomDisplay):
 
     def play_beep(self, beepid):
         """Provides audio feedback."""
+        if beepid not in self.beeps:
+            import psychopy.sound
+
+            self.beeps[beepid] = psychopy.sound.Sound(**self.beep_settings[beepid])
+
         self.beeps[beepid].play()
 
     def get_input_key(self):
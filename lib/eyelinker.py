@@ -4,11 +4,8 @@ Current module cite the code written by Colin Quirk (cquirk@uchicago.edu) and Jo
 
 Rewrite by Baiwei Liu (lbwair@icloud.com)
 """
-import os
 import sys
 import time
-import pygame
-from pygame.locals import *
 
 import pylink as pl
 from .PsychoPyCustomDisplay import PsychoPyCustomDisplay
@@ -58,7 +55,7 @@ def _get_connection_failure_response():
     return psychopy.event.waitKeys(keyList=['r', 'q', 'd'])[0]
 
 
-def EyeLinker(window, filename, eye, text_color=None):
+def EyeLinker(window, filename, eye, text_color=None, connection=None):
     """A factory function that either returns a ConnectedEyeLinker or MockEyeLinker.
     Parameters:
     window -- A psychopy.visual.Window object
@@ -66,7 +63,12 @@ def EyeLinker(window, filename, eye, text_color=None):
     eye -- Which eye(s) to track, either "LEFT", "RIGHT" or "BOTH"
     text_color -- Defined using window color to black or white, but can be overwritten by
      providing a (r,g,b) tuple with values between -1 and 1
+    connection -- optionally, a pylink.EyeLink that is already connected (e.g. made while the
+     window was being created)
     """
+    if connection is not None:
+        return ConnectedEyeLinker(window, filename, eye, text_color=None, tracker=connection)
+
     connected, e = _try_connection()
 
     if connected:
@@ -95,7 +97,7 @@ def EyeLinker(window, filename, eye, text_color=None):
 
 class ConnectedEyeLinker:
     """Returned if a connection is possible."""
-    def __init__(self, window, filename, eye, text_color=None):
+    def __init__(self, window, filename, eye, text_color=None, tracker=None):
         """See Eyelinker factory function for parameter info."""
         if len(filename) > 12:
             raise ValueError(
@@ -113,7 +115,7 @@ class ConnectedEyeLinker:
         self.edf_open = False
         self.eye = eye
         self.resolution = tuple(window.size)
-        self.tracker = pl.EyeLink()
+        self.tracker = pl.EyeLink() if tracker is None else tracker
         self.genv = PsychoPyCustomDisplay(self.window, self.tracker)
         self.mock = False
 
@@ -239,7 +241,9 @@ class ConnectedEyeLinker:
     def transfer_edf(self, new_filename=None):
         """Transfers the edf file to the computer running psychopy.
         Parameters:
-        new_filename -- optionally, a new filename for the edf file with no character restriciton.
+        new_filename -- optionally, a new filename (or full target path) for the edf file with
+         no character restriciton.
+        Returns the size of the transferred file in bytes, as reported by the tracker.
         """
         if not new_filename:
             new_filename = self.edf_filename
@@ -247,11 +251,15 @@ class ConnectedEyeLinker:
         if new_filename[-4:] != '.edf':
             raise ValueError('Please include the .edf extension in the filename.')
 
-        # Prevents timeouts due to excessive printing
-        sys.stdout = open(os.devnull, "w")
-        self.tracker.receiveDataFile(self.edf_filename, new_filename)
-        sys.stdout = sys.__stdout__
+        # Runs on a background thread (see eyetracker.EdfTransfer), so sys.stdout is left alone:
+        # swapping it would silence (and then lose any redirect of) the experiment's own output
+        size = self.tracker.receiveDataFile(self.edf_filename, new_filename)
+
+        if size is None or size <= 0:
+            raise RuntimeError('Transfer of %s failed (tracker returned %r).' % (self.edf_filename, size))
+
         print(new_filename + ' has been transferred successfully.')
+        return size
 
     def setup_tracker(self):
         """Enters setup menu on eyelink computer."""
@@ -584,7 +592,10 @@ def check_fix(start_loc, fix_loc, acceptableDev, Dis_for_sacc, scnSize, startime
     return Value
 
 def checkKeyEvent(KEYS_ALLOWED,TERMINATE_UPON_RESP,startime):
-    
+    # pygame is slow to import and only needed here
+    import pygame
+    from pygame.locals import KEYDOWN, K_KP_MULTIPLY, K_ESCAPE
+
     pl.flushGetkeyQueue(); 
     ev = pygame.event.get()
     gotKey = False; escapePressed = False
@@ -5,133 +5,400 @@ made by Anna van Harmelen, 2025
 see README.md for instructions if needed
 """
 
-# Import necessary stuff
-import traceback
-from psychopy import core, event
-import pandas as pd
-from participantinfo import get_participant_details
-from set_up import get_monitor_and_dir, get_settings
-from eyetracker import Eyelinker
-from practice import practice
-from trial import single_trial, generate_trial_characteristics
-from time import time
-from numpy import mean
+# Keep track of the start-up time from here on
+from time import perf_counter
 
-# from practice import practice
+STARTED = perf_counter()
+
+# Import necessary stuff (psychopy and the experiment itself are imported in main)
+import os
+import traceback
+import argparse
 import datetime as dt
-from block import (
-    create_trial_list,
-    block_break,
-    long_break,
-    finish,
-    quick_finish,
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+from participantinfo import (
+    get_participant_details,
+    get_session_details,
+    update_trials_completed,
+)
+from set_up import get_monitor_and_dir, prepare_backend
+from datalog import TrialLog, read_trial_log
+from sync import SyncAgent
+from dashboard import Dashboard, frame_drops
+from stats import SessionStats
+from startup import StartupProfile, preload
+from session import (
+    create_session_plan,
+    save_plan,
+    load_plan,
+    save_checkpoint,
+    restore_checkpoint,
+    save_json,
 )
+from schedule import save_schedule
+import tracing
+from tracing import span
 
 N_BLOCKS = 16
 TRIALS_PER_BLOCK = 48
 
+# Constraints on the randomisation of the whole session (see schedule.generate_schedule)
+SCHEDULE_CONSTRAINTS = dict(max_run_length=None, min_hue_distance=1)
+
+# Use a new .edf file for every block (transferred during the breaks)
+SEGMENTED_EDF = False
+
+# Collection server to upload the data directory to (None to keep everything local)
+SYNC_URL = None
 
-def main():
+# Port of the experimenter's dashboard, http://localhost:<port> (None to turn it off)
+DASHBOARD_PORT = 8050
+
+
+def main(
+    resume_session=None,
+    profile_startup=False,
+    simulation=None,
+    trace=False,
+    monitor_leaks=False,
+):
     """
+    Pass `resume_session` (a session number) to continue a session that crashed,
+    at the trial after the last one that was saved.
+    With `profile_startup`, the time until the first screen is printed per phase.
+    With `trace`, every part of every trial is timed, saved as a Chrome trace
+    (_trace.json, see tracing.py) and summarised at the end.
+    With `monitor_leaks`, memory use is sampled at every break (_memory.jsonl, see leaks.py).
+    With a `simulation` (see simulate.py) a simulated participant does the session,
+    on a headless window and without an eyetracker.
+
     Data formats / storage:
      - eyetracking data saved in one .edf file per session
+       (or one per block with SEGMENTED_EDF, listed in a _segments.json manifest)
      - all trial data saved in one .csv per session
-     - subject data in one .csv (for all sessions combined)
+       (built from a .jsonl log that every trial is appended to as it finishes)
+       and as typed columns in one .parquet per session
+     - subject data in one participants.db registry (for all sessions combined)
+     - the plan of the session (all trials) and a checkpoint, to be able to resume
+     - running statistics per condition cell, cue and block in one _stats.json per session
     """
 
     # Set whether this is a test run or not
     testing = False
 
+    if trace:
+        tracing.start()
+
+    profile = StartupProfile(STARTED)
+    profile.add("python imports", 0, profile.now())
+
     # Get monitor and directory information
     monitor, directory = get_monitor_and_dir(testing)
+    if simulation:
+        directory = simulation.directory
+
+        # A headless window has to be chosen before psychopy (pyglet) is imported
+        prepare_backend(simulation.backend)
+
+    # Import the slow libraries while the experimenter enters the participant details
+    imports = preload(
+        ["psychopy.visual", "psychopy.event", "psychopy.core", "psychopy.hardware.keyboard"]
+        + ([] if testing or simulation else ["lib.eyelinker"])
+        + ["numpy", "pandas"],
+        profile,
+    )
 
-    # Get participant details and save in same file as before
-    old_participants = pd.read_csv(
-        rf"{directory}\participantinfo.csv",
-        dtype={
-            "participant_number": int,
-            "session_number": int,
-            "age": int,
-            "trials_completed": str,
-        },
+    # Register participant and session (or look up the session to resume)
+    with profile.phase("participant registration"):
+        if resume_session is None:
+            details = get_participant_details(directory, testing or simulation is not None)
+        else:
+            details = get_session_details(directory, resume_session)
+    participant = details["participant_number"]
+    session = details["session_number"]
+    session_file = os.path.join(
+        directory, f"data_session_{session}{'_test' if testing else ''}"
     )
-    new_participants = get_participant_details(old_participants, testing)
 
-    # Initialise set-up
-    settings = get_settings(monitor, directory)
-    settings["keyboard"].clearEvents()
+    # Reload the plan and the data of the session that crashed
+    resume_block = None
+    if resume_session is not None:
+        plan = load_plan(f"{session_file}_plan.json")
+        data = read_trial_log(f"{session_file}.jsonl")
+        resume_block = len(data) // len(plan["blocks"][0]) + 1
+        print(
+            f"Resuming session {session} of participant {participant} "
+            f"in block {resume_block}, after {len(data)} trials"
+        )
 
-    # Connect to eyetracker and calibrate it
-    if not testing:
-        eyelinker = Eyelinker(
-            new_participants.participant_number.iloc[-1],
-            new_participants.session_number.iloc[-1],
-            settings["window"],
-            settings["directory"],
+    # Upload data in the background, but only during breaks (it starts paused)
+    sync_agent = None
+    if SYNC_URL and not testing:
+        sync_agent = SyncAgent(directory, SYNC_URL)
+        sync_agent.start()
+
+    # Now that the slow libraries are loaded, import the experiment itself
+    with profile.phase("waiting for imports"):
+        imports.join()
+    with profile.phase("import experiment"):
+        from psychopy import core
+        from set_up import get_settings
+        from eyetracker import Eyelinker, connect_to_tracker
+        from practice import practice
+        from trial import single_trial, schedule_characteristics
+        from trialtable import TrialTable
+        from warmup import warm_up
+        from preflight import preflight, PreflightStopped
+        from block import (
+            block_break,
+            long_break,
+            finish,
+            quick_finish,
+            wait_for_transfer,
         )
+
+    # Initialise set-up, and connect to the eyetracker in the mean time
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        connecting = None
+        if not testing and not simulation:
+            connecting = pool.submit(
+                profile.timed("eyetracker connection", connect_to_tracker)
+            )
+
+        with profile.phase("window and keyboard"):
+            if simulation:
+                settings = simulation.get_settings(monitor, directory)
+            else:
+                settings = get_settings(monitor, directory)
+            settings["keyboard"].clearEvents()
+
+        # Draw every stimulus once, so the first trials don't pay for it
+        with profile.phase("stimulus warm-up"):
+            save_json(warm_up(settings), f"{session_file}_warmup.json")
+
+        with profile.phase("waiting for eyetracker connection"):
+            connection = connecting.result() if connecting else None
+
+    # Set up the eyetracker and calibrate it
+    if simulation:
+        eyelinker = simulation.eyelinker(participant, session)
+    elif not testing:
+        with profile.phase("eyetracker set-up"):
+            eyelinker = Eyelinker(
+                participant,
+                session,
+                settings["window"],
+                settings["directory"],
+                segmented=SEGMENTED_EDF,
+                resume_block=resume_block,
+                connection=connection,
+            )
+
+    # Everything up to here is start-up
+    if profile_startup:
+        profile.report("first screen")
+
+    # Check the screen, eyetracker, keyboard, mouse and disk before the participant
+    # is calibrated (the experimenter can stop here when something is wrong)
+    if not simulation:
+        try:
+            preflight(
+                settings,
+                None if testing else eyelinker,
+                f"{session_file}_preflight.json"
+                if resume_session is None
+                else f"{session_file}_preflight_block{resume_block}.json",
+            )
+        except PreflightStopped as stopped:
+            print(f"{stopped} No trials were run in this session.")
+
+            # Nothing is recorded yet, but the .edf file is open and the tracker threads are running
+            if not testing:
+                wait_for_transfer(eyelinker.stop(), settings)
+                eyelinker.write_manifest()
+
+            # Register that no (more) trials were completed
+            update_trials_completed(
+                directory, session, 0 if resume_session is None else len(data)
+            )
+
+            if sync_agent:
+                sync_agent.stop()
+            core.quit()
+
+    if not testing:
         eyelinker.calibrate()
 
     # Start recording eyetracker
     if not testing:
         eyelinker.start()
 
-    # Practice until participant wants to stop
-    practice(settings)
+    # Practice until participant wants to stop (not needed again when resuming)
+    if resume_session is None:
+        practice(settings)
+
+        # Pseudo-randomly create conditions, colours, ITIs and wheel offsets for all blocks (so they're weighted)
+        plan = create_session_plan(
+            2 if testing else N_BLOCKS,
+            24 if testing else TRIALS_PER_BLOCK,
+            participant,
+            session,
+            details["age"],
+            **SCHEDULE_CONSTRAINTS,
+        )
+        save_plan(plan, f"{session_file}_plan.json")
+        save_schedule(
+            [row for trials in plan["blocks"] for row in trials],
+            f"{session_file}_schedule.csv",
+        )
+        data = []
+
+    # Make sure the random numbers continue where they left off
+    elif not restore_checkpoint(f"{session_file}_checkpoint.json", len(data)):
+        print("WARNING: no checkpoint for this trial, continuing with new random numbers.")
+
+    # Show the experimenter how it's going (updated between trials)
+    dashboard = None
+    if DASHBOARD_PORT:
+        dashboard = Dashboard(DASHBOARD_PORT)
+        if dashboard.start():
+            settings["count_frame_drops"] = True
+            dashboard.post(
+                {
+                    "type": "session",
+                    "participant_number": participant,
+                    "session_number": session,
+                    "total_trials": sum(len(trials) for trials in plan["blocks"]),
+                }
+            )
+            dashboard.flush()
+        else:
+            dashboard = None
+
+    # Check whether memory use grows from block to block
+    leak_monitor = None
+    if monitor_leaks:
+        from leaks import LeakMonitor
+
+        leak_monitor = LeakMonitor(f"{session_file}_memory.jsonl")
+        leak_monitor.sample(len(data) // len(plan["blocks"][0]))
 
     # Initialise some stuff
-    start_of_experiment = time()
-    data = []
-    current_trial = 0
+    trial_log = TrialLog(f"{session_file}.jsonl")
+    trial_table = TrialTable(sum(len(trials) for trials in plan["blocks"]))
+    session_stats = SessionStats()
+    for record in data:
+        trial_table.add(record)
+        session_stats.add(record)
+    start_of_experiment = plan["started_at"]
+    current_trial = len(data)
     finished_early = True
-    mouse = event.Mouse(visible=False, win=settings["window"])
+    mouse = settings["mouse_factory"](visible=False, win=settings["window"])
 
     # Start experiment
     try:
-        for block in range(2 if testing else N_BLOCKS):
-            # Pseudo-randomly create conditions and target locations (so they're weighted)
-            trials = create_trial_list(24 if testing else TRIALS_PER_BLOCK)
+        for block, trials in enumerate(plan["blocks"]):
+            # Skip the trials (and blocks) that were done before resuming
+            done = [record for record in data if record["block"] == block + 1]
+            if len(done) == len(trials):
+                continue
 
-            # Create temporary variable for saving block performance
-            block_performance = []
+            if sync_agent:
+                sync_agent.pause()
 
             # Run trials per pseudo-randomly created info
-            for trial in trials:
+            for trial in trials[len(done) :]:
                 current_trial += 1
+
+                # Make sure the previous trial is safely on disk, and that we can resume from here
+                with span("checkpoint"):
+                    trial_log.sync()
+                    save_checkpoint(f"{session_file}_checkpoint.json", current_trial - 1)
+
+                # Reconnect to the eyetracker if the link dropped during the last trial
+                if not testing:
+                    eyelinker.recover()
+                    eyelinker.start_trial()
+
                 start_time = time()
 
-                trial_characteristics: dict = generate_trial_characteristics(
-                    trial, settings
-                )
+                trial_characteristics: dict = schedule_characteristics(trial, settings)
 
                 # Generate trial
-                report: dict = single_trial(
-                    **trial_characteristics,
-                    settings=settings,
-                    testing=testing,
-                    eyetracker=None if testing else eyelinker,
-                )
+                with span("trial"):
+                    report: dict = single_trial(
+                        **trial_characteristics,
+                        settings=settings,
+                        testing=testing,
+                        eyetracker=None if testing else eyelinker,
+                    )
                 end_time = time()
 
+                # Count samples that didn't make it over the link
+                link_counts = {} if testing else eyelinker.end_trial(current_trial)
+
                 # Save trial data
-                data.append(
-                    {
-                        "trial_number": current_trial,
-                        "block": block + 1,
-                        "start_time": str(
-                            dt.timedelta(seconds=(start_time - start_of_experiment))
-                        ),
-                        "end_time": str(
-                            dt.timedelta(seconds=(end_time - start_of_experiment))
-                        ),
-                        **trial_characteristics,
-                        **report,
-                    }
-                )
+                record = {
+                    "trial_number": current_trial,
+                    "block": block + 1,
+                    "start_time": str(
+                        dt.timedelta(seconds=(start_time - start_of_experiment))
+                    ),
+                    "end_time": str(
+                        dt.timedelta(seconds=(end_time - start_of_experiment))
+                    ),
+                    **trial_characteristics,
+                    **report,
+                    **link_counts,
+                }
+                with span("save trial"):
+                    data.append(record)
+                    trial_log.append(record)
+                    trial_table.add(record)
+                    session_stats.add(record)
+
+                # Update the dashboard before the next trial's ITI
+                if dashboard:
+                    dashboard.post(
+                        {
+                            "type": "trial",
+                            **record,
+                            "frame_drops": frame_drops(
+                                settings["window"], settings["monitor"]["Hz"]
+                            ),
+                            "tracker": "not used"
+                            if testing
+                            else "lost" if getattr(eyelinker.tracker, "lost", False) else "ok",
+                        }
+                    )
+                    dashboard.flush()
+
+            # Make sure the whole block is on disk before the break
+            trial_log.sync(wait=True)
 
-                block_performance.append(report["performance"])
+            # Average performance score for most recent block
+            avg_score = round(session_stats.block(block + 1)["performance"]["mean"])
+            session_stats.save(f"{session_file}_stats.json")
 
-            # Calculate average performance score for most recent block
-            avg_score = round(mean(block_performance))
+            if leak_monitor:
+                leak_monitor.sample(block + 1)
+
+            if dashboard:
+                dashboard.post({"type": "block", "block": block + 1, "avg_score": avg_score})
+                dashboard.post({"type": "status", "message": f"break after block {block + 1}"})
+                dashboard.flush()
+
+            if sync_agent:
+                sync_agent.resume()
+
+            # A break is a good moment to retry a lost eyetracker connection
+            if not testing:
+                eyelinker.recover(new_block=True)
+
+            # Close this block's .edf file, it is transferred during the break
+            if not testing and SEGMENTED_EDF and block + 1 < N_BLOCKS:
+                eyelinker.end_segment(block + 1)
 
             # Break after end of block, unless it's the last block.
             # Experimenter can re-calibrate the eyetracker by pressing 'c' here.
@@ -145,6 +412,7 @@ def main():
                         eyetracker=None if testing else eyelinker,
                     )
                 if not testing:
+                    wait_for_transfer(eyelinker.transfer, settings)
                     eyelinker.start()
             elif block + 1 < N_BLOCKS:
                 while calibrated:
@@ -155,6 +423,9 @@ def main():
                         settings,
                         eyetracker=None if testing else eyelinker,
                     )
+                if not testing and SEGMENTED_EDF:
+                    wait_for_transfer(eyelinker.transfer, settings)
+                    eyelinker.start()
 
         finished_early = False
 
@@ -165,25 +436,24 @@ def main():
         traceback.print_exc()
 
     finally:
-        # Stop eyetracker (this should also save the data)
+        # Stop eyetracker, the data is transferred in the background
+        transfer = None
         if not testing:
-            eyelinker.stop()
+            transfer = eyelinker.stop(data[-1]["block"] if data else None)
+
+        # Save all logged trial data to a new .csv
+        import pandas as pd
 
-        # Save all collected trial data to a new .csv
-        pd.DataFrame(data).to_csv(
-            rf"{settings['directory']}\data_session_{new_participants.session_number.iloc[-1]}{'_test' if testing else ''}.csv",
+        trial_log.close()
+        pd.DataFrame(read_trial_log(f"{session_file}.jsonl")).to_csv(
+            f"{session_file}.csv",
             index=False,
         )
+        trial_table.save(session_file)
+        session_stats.save(f"{session_file}_stats.json")
 
         # Register how many trials this participant has completed
-        new_participants.loc[new_participants.index[-1], "trials_completed"] = str(
-            len(data)
-        )
-
-        # Save participant data to existing .csv file
-        new_participants.to_csv(
-            rf"{settings['directory']}\participantinfo.csv", index=False
-        )
+        update_trials_completed(settings["directory"], session, len(data))
 
         # Done!
         if finished_early:
@@ -192,8 +462,64 @@ def main():
             # Thanks for meedoen
             finish(N_BLOCKS, settings)
 
-        core.quit()
+        # Make sure the eyetracking data has arrived before closing
+        wait_for_transfer(transfer, settings)
+        if not testing:
+            eyelinker.write_manifest()
+
+        if dashboard:
+            dashboard.post(
+                {"type": "status", "message": "stopped early" if finished_early else "finished"}
+            )
+            dashboard.stop()
+
+        if leak_monitor:
+            leak_monitor.stop()
+
+        # Show where the time went
+        tracer = tracing.stop()
+        if tracer:
+            tracer.save_chrome_trace(f"{session_file}_trace.json")
+            tracer.report()
+
+        # Upload whatever is new
+        if sync_agent:
+            print("Uploading data to the collection server...")
+            sync_agent.stop()
+
+        # A simulated session can be followed by the next one
+        if not simulation:
+            core.quit()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--resume",
+        type=int,
+        metavar="SESSION",
+        help="continue this session from the last completed trial",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print how long each start-up phase takes",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="time every part of every trial, saved as a Chrome trace",
+    )
+    parser.add_argument(
+        "--monitor-leaks",
+        action="store_true",
+        help="sample memory use at every break and warn when it grows",
+    )
+    args = parser.parse_args()
+
+    main(
+        resume_session=args.resume,
+        profile_startup=args.profile_startup,
+        trace=args.trace,
+        monitor_leaks=args.monitor_leaks,
+    )
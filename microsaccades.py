@@ -0,0 +1,285 @@
+"""
+This script detects microsaccades in the eyetracking data, with the velocity threshold of
+Engbert & Kliegl (2003): a sample is part of a (micro)saccade when its velocity is more than
+`threshold` times the median-based standard deviation of the velocities of the whole recording.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+usage:
+
+    python microsaccades.py 12_3456.asc 13_3457.asc --out parsed [--threshold 6] [--processes 4]
+    python microsaccades.py parsed/12_3456 ...      # already parsed with asc.py
+    python microsaccades.py --benchmark             # compare with a loop over every sample
+
+Saves <session>_microsaccades.npy next to the parsed samples, see MICROSACCADE_DTYPE.
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import math
+import os
+import statistics
+import tempfile
+import timeit
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+
+from asc import parse_asc, load_samples, write_synthetic_asc
+
+# start, end (tracker time in ms), amplitude (px, or deg with pixels_per_degree),
+# peak velocity (px/s or deg/s), direction (degrees, 0 is right and 90 up) and displacement
+MICROSACCADE_DTYPE = np.dtype(
+    [
+        ("start", "<f8"),
+        ("end", "<f8"),
+        ("duration", "<f8"),
+        ("amplitude", "<f8"),
+        ("peak_velocity", "<f8"),
+        ("direction", "<f8"),
+        ("dx", "<f8"),
+        ("dy", "<f8"),
+    ]
+)
+
+# Engbert & Kliegl (2003): velocity threshold in median-based SDs, shortest (micro)saccade in ms
+THRESHOLD = 6
+MIN_DURATION = 6
+
+# Larger eye movements aren't microsaccades
+MAX_AMPLITUDE_DEGREES = 1
+
+
+def velocities(time, x, y, rate):
+    """
+    Horizontal and vertical velocity of every sample from the 5 samples around it (Engbert &
+    Kliegl, 2003), NaN at the edges, around missing samples (blinks) and wherever recording
+    stopped in between.
+    """
+    velocity = []
+    for position in (x, y):
+        v = np.full(len(position), np.nan, dtype=position.dtype)
+        if len(position) >= 5:
+            # In place, to not make a new array of the whole recording for every step
+            window = v[2:-2]
+            np.subtract(position[4:], position[:-4], out=window)
+            window += position[3:-1]
+            window -= position[1:-3]
+            window *= rate / 6
+        velocity.append(v)
+
+    # Every window with a break between two of its samples
+    breaks = np.flatnonzero(np.abs(np.diff(time) - 1000 / rate) > 1000 / rate / 2)
+    around = (breaks[:, None] + np.arange(-1, 3)).ravel()
+    around = around[(around >= 0) & (around < len(x))]
+    for v in velocity:
+        v[around] = np.nan
+
+    return velocity
+
+
+def median_sd(velocity):
+    """The median-based standard deviation of the velocity (NaNs left out)."""
+    # A copy, that is partitioned in place from here on
+    velocity = velocity[~np.isnan(velocity)]
+    if not len(velocity):
+        return np.nan
+
+    median = partition_median(velocity)
+    np.abs(velocity, out=velocity)
+
+    # The median of the squares is the square of the median of the absolute values
+    return np.sqrt(partition_median(velocity) ** 2 - median**2)
+
+
+def partition_median(values):
+    # Like np.median, but without copying `values` (which ends up partitioned)
+    middle = [(len(values) - 1) // 2, len(values) // 2]
+    values.partition(middle)
+    return (float(values[middle[0]]) + float(values[middle[1]])) / 2
+
+
+def detect(
+    time,
+    x,
+    y,
+    rate=None,
+    threshold=THRESHOLD,
+    min_duration=MIN_DURATION,
+    pixels_per_degree=None,
+    max_amplitude=None,
+):
+    """
+    Returns the microsaccades (see MICROSACCADE_DTYPE) in one recording, without looping over
+    samples: the threshold is applied to whole arrays at once, and the microsaccades are then
+    measured with `reduceat` over only their own samples.
+    """
+    time = np.asarray(time, dtype=np.float64)
+    if rate is None:
+        rate = 1000 / np.median(np.diff(time[:1000])) if len(time) > 1 else 1000
+    if max_amplitude is None and pixels_per_degree:
+        max_amplitude = MAX_AMPLITUDE_DEGREES
+
+    # Samples are saved as float32 (see asc.SAMPLE_DTYPE), which is plenty precise
+    x = np.asarray(x, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float32)
+    if pixels_per_degree:
+        x = x / pixels_per_degree
+        y = y / pixels_per_degree
+
+    vx, vy = velocities(time, x, y, rate)
+    radius_x = threshold * median_sd(vx)
+    radius_y = threshold * median_sd(vy)
+
+    # Inside the ellipse with the thresholds as radii is not a saccade (NaN never is)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        distance = np.square(vx / radius_x)
+        distance += np.square(vy / radius_y)
+        above = distance > 1
+
+    # Runs of samples above the threshold
+    edges = np.diff(above.view(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    long_enough = (ends - starts + 1) >= math.ceil(min_duration * rate / 1000)
+    starts, ends = starts[long_enough], ends[long_enough]
+
+    microsaccades = np.zeros(len(starts), dtype=MICROSACCADE_DTYPE)
+    if not len(starts):
+        return microsaccades
+
+    # The samples of all runs one after the other, and where every run starts in them
+    lengths = ends - starts + 1
+    offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+    samples = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+    def per_run(function, values):
+        return function.reduceat(values[samples], offsets)
+
+    # Engbert & Kliegl's amplitude: the size of the whole movement, from the furthest positions during it
+    extent_x = per_run(np.maximum, x) - per_run(np.minimum, x)
+    extent_y = per_run(np.maximum, y) - per_run(np.minimum, y)
+    dx = x[ends] - x[starts]
+    dy = y[ends] - y[starts]
+
+    microsaccades["start"] = time[starts]
+    microsaccades["end"] = time[ends]
+    microsaccades["duration"] = time[ends] - time[starts] + 1000 / rate
+    microsaccades["amplitude"] = np.hypot(extent_x, extent_y)
+    microsaccades["peak_velocity"] = np.maximum.reduceat(np.hypot(vx[samples], vy[samples]), offsets)
+    # The y axis of the screen points down
+    microsaccades["direction"] = np.degrees(np.arctan2(-dy, dx))
+    microsaccades["dx"] = dx
+    microsaccades["dy"] = dy
+
+    if max_amplitude is not None:
+        microsaccades = microsaccades[microsaccades["amplitude"] <= max_amplitude]
+
+    return microsaccades
+
+
+def detect_file(path, out_directory="parsed", **options):
+    """Detects the microsaccades in an .asc file (parsed first) or parsed recording, returns where they're saved."""
+    prefix = parse_asc(path, out_directory) if path.endswith(".asc") else path
+    samples = load_samples(prefix)
+
+    microsaccades = detect(samples["time"], samples["x"], samples["y"], **options)
+    np.save(f"{prefix}_microsaccades.npy", microsaccades)
+
+    return f"{prefix}_microsaccades.npy"
+
+
+def detect_files(paths, out_directory="parsed", processes=None, **options):
+    """Runs detect_file on every file on its own process."""
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(detect_file, path, out_directory, **options) for path in paths]
+        return [future.result() for future in futures]
+
+
+def detect_loop(time, x, y, rate, threshold=THRESHOLD, min_duration=MIN_DURATION):
+    """The same detection one sample at a time (without the amplitude filter), to compare against."""
+    n = len(x)
+    vx = [math.nan] * n
+    vy = [math.nan] * n
+    for i in range(2, n - 2):
+        if abs(time[i + 2] - time[i - 2] - 4000 / rate) <= 1000 / rate / 2:
+            vx[i] = (x[i + 2] + x[i + 1] - x[i - 1] - x[i - 2]) * rate / 6
+            vy[i] = (y[i + 2] + y[i + 1] - y[i - 1] - y[i - 2]) * rate / 6
+
+    radii = []
+    for v in (vx, vy):
+        valid = [value for value in v if not math.isnan(value)]
+        radii.append(
+            threshold
+            * math.sqrt(
+                statistics.median([value**2 for value in valid]) - statistics.median(valid) ** 2
+            )
+        )
+
+    microsaccades = []
+    start = None
+    for i in range(n + 1):
+        above = i < n and (vx[i] / radii[0]) ** 2 + (vy[i] / radii[1]) ** 2 > 1
+        if above and start is None:
+            start = i
+        elif not above and start is not None:
+            if i - start >= math.ceil(min_duration * rate / 1000):
+                microsaccades.append((time[start], time[i - 1]))
+            start = None
+
+    return microsaccades
+
+
+def benchmark(hours=1, rate=1000):
+    """Times detect and detect_loop on a synthetic recording of `hours`."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "synthetic.asc")
+        onsets, _ = write_synthetic_asc(path, seconds=hours * 3600, rate=rate)
+        samples = load_samples(parse_asc(path, directory))
+        time, x, y = (np.array(samples[name]) for name in ("time", "x", "y"))
+
+    # The fastest of a few runs, like benchmark.py (the first also pays for allocating memory)
+    microsaccades = detect(time, x, y, rate)
+    vectorised = min(timeit.repeat(lambda: detect(time, x, y, rate), number=1, repeat=5))
+
+    started = perf_counter()
+    detect_loop(time, x, y, rate)
+    loop = perf_counter() - started
+
+    found = np.isin(onsets, microsaccades["start"] + np.arange(-5, 6)[:, None])
+    print(
+        f"{len(time)} samples: detect {vectorised:.2f} s, loop {loop:.1f} s "
+        f"({loop / vectorised:.0f}x slower); found {found.mean():.0%} of {len(onsets)} "
+        f"microsaccades put in ({len(microsaccades)} detected)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*", help=".asc files, or recordings parsed with asc.py")
+    parser.add_argument("--out", default="parsed", help="where to save the parsed .asc files")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="in median-based SDs")
+    parser.add_argument("--min-duration", type=float, default=MIN_DURATION, help="in ms")
+    parser.add_argument("--pixels-per-degree", type=float, help="to report degrees instead of pixels")
+    parser.add_argument("--processes", type=int, help="how many files to do at once")
+    parser.add_argument("--benchmark", action="store_true", help="time on a synthetic 1-hour recording")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+
+    if args.files:
+        for path in detect_files(
+            args.files,
+            args.out,
+            args.processes,
+            threshold=args.threshold,
+            min_duration=args.min_duration,
+            pixels_per_degree=args.pixels_per_degree,
+        ):
+            microsaccades = np.load(path)
+            print(
+                f"{path}: {len(microsaccades)} microsaccades, median amplitude "
+                f"{np.median(microsaccades['amplitude']) if len(microsaccades) else float('nan'):.2f}"
+            )
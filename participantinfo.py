@@ -6,32 +6,199 @@ To run the 'microsaccade bias temporal separation' experiment, see main.py.
 made by Anna van Harmelen, 2025
 """
 
-import random
-import pandas as pd
+import csv
+import os
+import sqlite3
+from contextlib import contextmanager
+from time import sleep, time
 
+REGISTRY = "participants.db"
 
-def get_participant_details(existing_participants: pd.DataFrame, testing):
-    # Generate random & unique participant number
-    participant = random.randint(10, 99)
-    while participant in existing_participants.participant_number.tolist():
-        participant = random.randint(10, 99)
-    
-    print(f"Participant number: {participant}")
+# New participant numbers are spread over 100-9999 in a fixed, shuffled-looking order.
+# This keeps '<session>_<participant>.edf' within the tracker's 12 characters,
+# as long as sessions stay below 1000 (checked by check_edf_name).
+# (ID_STEP must not share a factor with ID_SPACE, so every number is used exactly once.)
+ID_START = 100
+ID_SPACE = 9900
+ID_STEP = 7919
+ID_OFFSET = 4567
+
+# The tracker only accepts .edf filenames of up to 12 characters, including '.edf'
+EDF_NAME_LENGTH = 12
 
+
+def get_participant_details(directory, testing):
+    """
+    Registers a new participant and session, returns their details as a dict
+    with participant_number, session_number and age.
+    """
     if not testing:
         # Get participant age
         age = int(input("Participant age: "))
     else:
         age = 00
 
-    # Insert session number
-    session = max(existing_participants.session_number) + 1
+    with open_registry(directory) as registry:
+        participant = allocate_participant_number(registry)
+        registry.execute(
+            "INSERT INTO participants (participant_number, age) VALUES (?, ?)",
+            (participant, age),
+        )
+        session = registry.execute(
+            "INSERT INTO sessions (participant_number, started_at) VALUES (?, ?)",
+            (participant, time()),
+        ).lastrowid
+
+        # Not registered (rolled back) when the .edf filename wouldn't fit
+        check_edf_name(participant, session)
+
+    print(f"Participant number: {participant}")
+
+    return {"participant_number": participant, "session_number": session, "age": age}
+
+
+def get_session_details(directory, session):
+    with open_registry(directory) as registry:
+        row = registry.execute(
+            "SELECT p.participant_number, s.session_number, p.age FROM sessions s "
+            "JOIN participants p ON p.participant_number = s.participant_number "
+            "WHERE s.session_number = ?",
+            (session,),
+        ).fetchone()
+
+    if row is None:
+        raise Exception(f"Session {session} is not in the participant registry.")
+
+    return {"participant_number": row[0], "session_number": row[1], "age": row[2]}
+
+
+def check_edf_name(participant, session):
+    # The .edf file is named '<session>_<participant>.edf' (see eyetracker.Eyelinker)
+    filename = f"{session}_{participant}.edf"
+    if len(filename) > EDF_NAME_LENGTH:
+        raise Exception(
+            f"Session {session} of participant {participant} would be recorded as {filename}, "
+            f"longer than the {EDF_NAME_LENGTH} characters the eyetracker accepts "
+            f"(session numbers can only go up to {10 ** (EDF_NAME_LENGTH - len(f'_{participant}.edf')) - 1} "
+            "for this participant)."
+        )
+
+
+def update_trials_completed(directory, session, trials_completed):
+    with open_registry(directory) as registry:
+        registry.execute(
+            "UPDATE sessions SET trials_completed = ? WHERE session_number = ?",
+            (trials_completed, session),
+        )
+
+
+def allocate_participant_number(registry):
+    # Take the next position in the ID sequence, skipping numbers already in use
+    while True:
+        (index,) = registry.execute(
+            "SELECT value FROM counters WHERE name = 'participant'"
+        ).fetchone()
+        registry.execute(
+            "UPDATE counters SET value = value + 1 WHERE name = 'participant'"
+        )
+        if index >= ID_SPACE:
+            raise Exception("All participant numbers have been used.")
+
+        participant = ID_START + (index * ID_STEP + ID_OFFSET) % ID_SPACE
+        if not registry.execute(
+            "SELECT 1 FROM participants WHERE participant_number = ?", (participant,)
+        ).fetchone():
+            return participant
+
+
+@contextmanager
+def open_registry(directory, timeout=30):
+    """
+    Opens the participant registry for one transaction.
+    Other lab PCs wait (up to `timeout` seconds) until the registry is free again.
+    SQLite's own locking isn't reliable on network drives, so a lock file is used as well.
+    """
+    path = os.path.join(directory, REGISTRY)
+
+    with lock_file(path + ".lock", timeout):
+        new = not os.path.exists(path)
+        registry = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        try:
+            # If this fails (e.g. the registry stays locked) there is nothing to roll back
+            registry.execute("BEGIN IMMEDIATE")
+            try:
+                if new:
+                    create_registry(registry, directory)
+                yield registry
+                registry.execute("COMMIT")
+            except Exception:
+                registry.execute("ROLLBACK")
+                raise
+        finally:
+            # Closing without a commit rolls back as well (e.g. after a KeyboardInterrupt)
+            registry.close()
+
+
+def create_registry(registry, directory):
+    for statement in (
+        "CREATE TABLE participants ("
+        " participant_number INTEGER PRIMARY KEY, age INTEGER)",
+        "CREATE TABLE sessions ("
+        " session_number INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " participant_number INTEGER NOT NULL REFERENCES participants,"
+        " trials_completed INTEGER, started_at REAL)",
+        "CREATE INDEX sessions_by_participant ON sessions (participant_number)",
+        "CREATE TABLE counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        "INSERT INTO counters VALUES ('participant', 0)",
+    ):
+        registry.execute(statement)
+
+    # Take over the participants from the old .csv file
+    old_file = os.path.join(directory, "participantinfo.csv")
+    if not os.path.exists(old_file):
+        return
+
+    with open(old_file, newline="") as file:
+        for row in csv.DictReader(file):
+            registry.execute(
+                "INSERT OR IGNORE INTO participants VALUES (?, ?)",
+                (int(row["participant_number"]), int(row["age"])),
+            )
+            registry.execute(
+                "INSERT INTO sessions (session_number, participant_number, trials_completed) "
+                "VALUES (?, ?, ?)",
+                (
+                    int(row["session_number"]),
+                    int(row["participant_number"]),
+                    int(float(row["trials_completed"]))
+                    if row.get("trials_completed")
+                    else None,
+                ),
+            )
+
+
+@contextmanager
+def lock_file(path, timeout, stale_after=120):
+    start = time()
+    while True:
+        try:
+            handle = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            # Left behind by a crashed PC
+            try:
+                if time() - os.path.getmtime(path) > stale_after:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
 
-    new_participant = pd.DataFrame(
-        {"age": [age], "participant_number": [participant], "session_number": [session]}
-    )
-    all_participants = pd.concat(
-        [existing_participants, new_participant], ignore_index=True
-    )
+            if time() - start > timeout:
+                raise TimeoutError(f"Participant registry is locked ({path}).")
+            sleep(0.1)
 
-    return all_participants
+    try:
+        yield
+    finally:
+        os.close(handle)
+        os.remove(path)
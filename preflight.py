@@ -0,0 +1,229 @@
+"""
+This file contains the functions necessary for
+checking the set-up (screen, eyetracker, keyboard, mouse and disk) before a participant starts.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import json
+import os
+import statistics
+from time import perf_counter, sleep
+
+from stimuli import show_text
+from response import wait_for_key
+from session import save_json
+
+# How much worse than the rig's baseline a result may be before warning about it
+TOLERANCE = 1.5
+
+# Results where higher is better (for all others lower is better)
+HIGHER_IS_BETTER = ["disk_mb_per_s"]
+
+
+class PreflightStopped(Exception):
+    """The experimenter stopped the session at the pre-flight check (see main.py)."""
+
+
+def probe_refresh(window, hz, n_frames=240):
+    """Flips `n_frames` times, returns the measured refresh rate and how much frame times vary."""
+    window.flip()
+    flips = []
+    for _ in range(n_frames):
+        window.flip()
+        flips.append(perf_counter())
+
+    intervals = [(b - a) * 1000 for a, b in zip(flips, flips[1:])]
+    frame = 1000 / hz
+
+    return {
+        "refresh_hz": 1000 / statistics.median(intervals),
+        "expected_hz": hz,
+        "flip_jitter_ms": statistics.stdev(intervals),
+        "longest_frame_ms": max(intervals),
+        "dropped_frames": sum(interval > 1.5 * frame for interval in intervals),
+    }
+
+
+def probe_tracker(eyelinker, n=50):
+    """
+    Times sending a message, and how old the newest sample is compared to the tracker's clock
+    (only with a real tracker). This runs before calibration, so the tracker only sends
+    samples over the link for a moment (nothing is written to the .edf).
+    """
+    results = {"send_message_ms": None, "tracker_time_ms": None, "sample_age_ms": None}
+    if eyelinker is None:
+        return results
+
+    durations = []
+    for index in range(n):
+        started = perf_counter()
+        eyelinker.tracker.send_message(f"preflight {index}")
+        durations.append((perf_counter() - started) * 1000)
+    results["send_message_ms"] = statistics.median(durations)
+
+    link = getattr(eyelinker.tracker, "tracker", None)
+    if link is None or getattr(eyelinker.tracker, "mock", True):
+        return results
+
+    round_trips = []
+    ages = []
+    with eyelinker.tracker.lock:
+        # Samples over the link only: no samples or events in the file
+        link.startRecording(0, 0, 1, 0)
+        sleep(0.1)
+        for _ in range(n):
+            started = perf_counter()
+            tracker_time = link.trackerTime()
+            round_trips.append((perf_counter() - started) * 1000)
+
+            sample = link.getNewestSample()
+            if sample is not None:
+                ages.append(tracker_time - sample.getTime())
+            sleep(0.005)
+        link.stopRecording()
+
+    results["tracker_time_ms"] = statistics.median(round_trips)
+    results["sample_age_ms"] = statistics.median(ages) if ages else None
+
+    return results
+
+
+def probe_input(settings, n=5, timeout=10):
+    """
+    Asks the experimenter to press SPACE and click `n` times, and measures how long it takes
+    until the experiment sees each press (from the device's own timestamp).
+    Skipped with a fake keyboard or mouse (see headless.py).
+    """
+    results = {"key_latency_ms": None, "click_latency_ms": None}
+    keyboard = settings["keyboard"]
+    if getattr(keyboard, "fake", False):
+        return results
+
+    window = settings["window"]
+
+    show_text(f"Pre-flight check: press SPACE {n} times.", window)
+    window.flip()
+    keyboard.clearEvents()
+    latencies = []
+    started = perf_counter()
+    while len(latencies) < n and perf_counter() - started < timeout:
+        for key in keyboard.getKeys(["space"], waitRelease=False):
+            latencies.append((keyboard.clock.getTime() - key.rt) * 1000)
+    if latencies:
+        results["key_latency_ms"] = statistics.median(latencies)
+
+    mouse = settings["mouse_factory"](visible=True, win=window)
+    if not hasattr(mouse, "clickReset"):
+        return results
+
+    show_text(f"Pre-flight check: click the mouse {n} times.", window)
+    window.flip()
+    mouse.clickReset()
+    latencies = []
+    started = perf_counter()
+    was_pressed = False
+    while len(latencies) < n and perf_counter() - started < timeout:
+        buttons, times = mouse.getPressed(getTime=True)
+        if buttons[0] and not was_pressed:
+            latencies.append((mouse.mouseClock.getTime() - times[0]) * 1000)
+        was_pressed = buttons[0]
+    mouse.setVisible(False)
+    if latencies:
+        results["click_latency_ms"] = statistics.median(latencies)
+
+    return results
+
+
+def probe_disk(directory, n_chunks=256, chunk_size=64 * 1024):
+    """Appends `n_chunks` chunks to a file in the data directory, and times one append + fsync (like every trial)."""
+    path = os.path.join(directory, "preflight.tmp")
+    chunk = os.urandom(chunk_size)
+
+    try:
+        started = perf_counter()
+        with open(path, "ab") as file:
+            for _ in range(n_chunks):
+                file.write(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+        throughput = n_chunks * chunk_size / 1e6 / (perf_counter() - started)
+
+        syncs = []
+        with open(path, "ab") as file:
+            for _ in range(20):
+                started = perf_counter()
+                file.write(chunk[:1024])
+                file.flush()
+                os.fsync(file.fileno())
+                syncs.append((perf_counter() - started) * 1000)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    return {"disk_mb_per_s": throughput, "disk_sync_ms": statistics.median(syncs)}
+
+
+def compare_to_baseline(results, baseline):
+    """Returns a warning for every result that is more than TOLERANCE times worse than the baseline."""
+    warnings = []
+
+    # The refresh rate is compared to what it should be
+    if abs(results["refresh_hz"] - results["expected_hz"]) > 0.01 * results["expected_hz"]:
+        warnings.append(
+            f"refresh rate is {results['refresh_hz']:.1f} Hz, expected {results['expected_hz']} Hz"
+        )
+
+    for name, value in results.items():
+        before = baseline.get(name)
+        if name == "expected_hz" or value is None or not before:
+            continue
+
+        worse = before / value if name in HIGHER_IS_BETTER else value / before
+        if worse > TOLERANCE:
+            warnings.append(f"{name} is {value:.2f} (baseline {before:.2f})")
+
+    return warnings
+
+
+def preflight(settings, eyelinker, path):
+    """
+    Runs all probes, saves the results to `path` and compares them against the rig's
+    baseline (rig_baseline.json in the data directory, made by the first run).
+    Shows any warnings on the screen: SPACE continues anyway, Q stops the session
+    (raises PreflightStopped).
+    Run this before calibration, so nobody has been seated for a rig that isn't working.
+    """
+    results = {
+        **probe_refresh(settings["window"], settings["monitor"]["Hz"]),
+        **probe_tracker(eyelinker),
+        **probe_input(settings),
+        **probe_disk(settings["directory"]),
+    }
+
+    baseline_path = os.path.join(settings["directory"], "rig_baseline.json")
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+    else:
+        print(f"No rig baseline yet, saving these results as {baseline_path}")
+        save_json(results, baseline_path)
+        baseline = results
+
+    warnings = compare_to_baseline(results, baseline)
+    save_json({"results": results, "baseline": baseline, "warnings": warnings}, path)
+
+    if warnings:
+        print("Pre-flight check:\n  " + "\n  ".join(warnings))
+        show_text(
+            "Pre-flight check found problems:\n\n"
+            + "\n".join(warnings)
+            + "\n\nPress SPACE to continue anyway, or Q to stop.",
+            settings["window"],
+        )
+        settings["window"].flip()
+        if "q" in wait_for_key(["space", "q"], settings["keyboard"]):
+            raise PreflightStopped("Stopped at the pre-flight check.")
+
+    return results, warnings
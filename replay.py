@@ -0,0 +1,236 @@
+"""
+This script replays the trials of a session exactly as they were shown,
+on a window without a display (see --backend) and without waiting, to check what was on the screen.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+usage:
+
+    python replay.py data_session_12.jsonl --out replay_12.json [--frames frames_12] [--backend offscreen]
+    python replay.py data_session_12.jsonl --compare replay_12.json
+
+Every screen (window flip) of every trial is saved as a hash (and optionally as a .png),
+so two replays, e.g. before and after changing the code, can be compared screen by screen.
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import ast
+import csv
+import hashlib
+import json
+import os
+import numpy as np
+
+from headless import VirtualClock, virtual_time
+from set_up import BACKENDS, get_monitor_and_dir, get_settings
+
+# Columns that are saved as text in the .csv
+LIST_COLUMNS = [
+    "stimuli_colours",
+    "positions",
+    "probe_colour",
+    "target_colour",
+    "selected_colour",
+]
+INT_COLUMNS = [
+    "trial_number",
+    "ITI",
+    "target_item",
+    "retrocue",
+    "colour_wheel_offset",
+    "performance",
+]
+
+
+class ReplayMouse:
+    """Mouse driver (see headless.FakeMouse): moves straight to `position` and clicks."""
+
+    def __init__(self):
+        self.position = (0, 0)
+
+    def __call__(self, mouse):
+        mouse.position = self.position
+        mouse.moved = True
+        mouse.pressed = [1, 0, 0]
+
+
+def mouse_position_for(selected_colour, offset, settings):
+    # Mouse position on the wheel at which get_colour returns the selected colour
+    import response
+
+    radius = settings["deg2pix"]((response.RADIUS + response.INNER_RADIUS) / 2)
+    hue = settings["colours"].index(selected_colour)
+
+    for nudge in (0.5, -0.5, 1.5):
+        angle = (hue + offset + nudge) % 360
+        position = (
+            radius * np.cos(np.radians(angle)),
+            radius * np.sin(np.radians(angle)),
+        )
+        colour, _ = response.get_colour(position, offset, settings["colours"])
+        if colour == selected_colour:
+            return position
+
+    raise Exception(f"Can't find where {selected_colour!r} is on a wheel with offset {offset}.")
+
+
+class FrameRecorder:
+    """Hashes (and optionally saves) the back buffer every time the window is flipped."""
+
+    def __init__(self, window, clock, frames_directory=None):
+        self.window = window
+        self.clock = clock
+        self.frames_directory = frames_directory
+        self.frames = []
+        self.trial_number = None
+        self.flip = window.flip
+
+    def __enter__(self):
+        self.window.flip = self.recording_flip
+        return self
+
+    def __exit__(self, *exc):
+        self.window.flip = self.flip
+
+    def recording_flip(self, *args, **kwargs):
+        image = self.window._getFrame(buffer="back")
+        digest = hashlib.sha1(image.tobytes()).hexdigest()
+
+        if self.frames_directory:
+            image.save(
+                os.path.join(
+                    self.frames_directory,
+                    f"trial{self.trial_number:03d}_frame{len(self.frames):03d}.png",
+                )
+            )
+
+        self.frames.append(
+            {"trial_number": self.trial_number, "time": self.clock.time(), "hash": digest}
+        )
+
+        return self.flip(*args, **kwargs)
+
+
+def read_records(path):
+    """Reads trial records from a session's .jsonl log or its .csv."""
+    if path.endswith(".jsonl"):
+        from datalog import read_trial_log
+
+        return read_trial_log(path)
+
+    with open(path, newline="") as file:
+        records = list(csv.DictReader(file))
+
+    for record in records:
+        for column in LIST_COLUMNS:
+            record[column] = ast.literal_eval(record[column])
+        for column in INT_COLUMNS:
+            record[column] = int(record[column])
+
+    return records
+
+
+def replay_session(records, settings, replay_mouse, frames_directory=None):
+    """
+    Runs single_trial for every record (with the recorded colours, positions, cue and
+    wheel offset, and the recorded response) and returns every frame and any mismatches.
+    `settings` should come from get_settings(..., mouse_driver=replay_mouse).
+    """
+    # Only import psychopy (with trial) here, once the backend has been chosen
+    import trial
+
+    clock = VirtualClock()
+    mismatches = []
+
+    if frames_directory:
+        os.makedirs(frames_directory, exist_ok=True)
+
+    with virtual_time(clock), FrameRecorder(
+        settings["window"], clock, frames_directory
+    ) as recorder:
+        for record in records:
+            recorder.trial_number = record["trial_number"]
+            replay_mouse.position = mouse_position_for(
+                record["selected_colour"], record["colour_wheel_offset"], settings
+            )
+
+            report = trial.single_trial(
+                ITI=record["ITI"],
+                stimuli_colours=record["stimuli_colours"],
+                positions=record["positions"],
+                probe_colour=record["probe_colour"],
+                target_item=record["target_item"],
+                target_colour=record["target_colour"],
+                target_position=record["target_position"],
+                retrocue=record["retrocue"],
+                settings=settings,
+                testing=True,
+                colour_wheel_offset=record["colour_wheel_offset"],
+            )
+
+            # The replayed response should score exactly the same
+            for key in ("selected_colour", "performance"):
+                if report[key] != record[key]:
+                    mismatches.append(
+                        {
+                            "trial_number": record["trial_number"],
+                            "field": key,
+                            "recorded": record[key],
+                            "replayed": report[key],
+                        }
+                    )
+
+    return {"frames": recorder.frames, "mismatches": mismatches}
+
+
+def compare_replays(old, new):
+    """Returns the frames that differ between two replays of the same session."""
+    differences = [
+        {"trial_number": a["trial_number"], "frame": index, "old": a["hash"], "new": b["hash"]}
+        for index, (a, b) in enumerate(zip(old["frames"], new["frames"]))
+        if a["hash"] != b["hash"]
+    ]
+
+    if len(old["frames"]) != len(new["frames"]):
+        differences.append(
+            {"frame_count": {"old": len(old["frames"]), "new": len(new["frames"])}}
+        )
+
+    return differences
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("records", help="a session's data_session_*.jsonl or .csv")
+    parser.add_argument("--out", help="where to save the frame hashes (.json)")
+    parser.add_argument("--frames", help="directory to save every frame as .png")
+    parser.add_argument("--compare", help="an earlier replay (.json) to compare against")
+    parser.add_argument("--backend", default="offscreen", choices=BACKENDS[1:])
+    args = parser.parse_args()
+
+    monitor, directory = get_monitor_and_dir(False)
+    replay_mouse = ReplayMouse()
+    settings = get_settings(monitor, directory, backend=args.backend, mouse_driver=replay_mouse)
+
+    records = read_records(args.records)
+    replay = replay_session(records, settings, replay_mouse, args.frames)
+    settings["window"].close()
+
+    print(
+        f"Replayed {len(records)} trials, {len(replay['frames'])} frames, "
+        f"{len(replay['mismatches'])} mismatching responses."
+    )
+    for mismatch in replay["mismatches"]:
+        print(f"  {mismatch}")
+
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(replay, file)
+
+    if args.compare:
+        with open(args.compare) as file:
+            differences = compare_replays(json.load(file), replay)
+        print(f"{len(differences)} frames differ from {args.compare}")
+        for difference in differences[:20]:
+            print(f"  {difference}")
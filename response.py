@@ -18,6 +18,7 @@ from stimuli import (
 from time import time
 import numpy as np
 from eyetracker import get_trigger
+from tracing import span
 import random
 
 
@@ -92,6 +93,23 @@ def evaluate_response(selected_colour, target_colour, colours):
     }
 
 
+def draw_response_screen(colour_wheel, target_item, retrocue, additional_objects, settings):
+    # Draw each wedge
+    for wedge in colour_wheel:
+        wedge.draw()
+
+    # Draw fixation dot
+    draw_fixation_dot(settings)
+
+    # Show retrocue if applicable
+    if retrocue == 0:
+        create_retrocue(target_item, settings)
+
+    # Show additional objects if applicable
+    for object in additional_objects:
+        object.draw()
+
+
 def get_response(
     target_colour,
     positions,
@@ -101,6 +119,7 @@ def get_response(
     testing,
     eyetracker,
     additional_objects=[],
+    offset=None,
 ):
     keyboard: Keyboard = settings["keyboard"]
 
@@ -111,32 +130,25 @@ def get_response(
     idle_reaction_time_start = time()
     keyboard.clock.reset()
 
-    # Prepare the colour wheel and initialise variables
-    offset = random.randint(0, 360)
-    colour_wheel = create_colour_wheel(offset, settings)
-    mouse = event.Mouse(visible=True, win=settings["window"])
-    mouse.getPos()
-    marker = make_marker(RADIUS, INNER_RADIUS, settings)
-    marker.colorSpace="hsv"
-    selected_colour = None
+    # Prepare the colour wheel (at a random rotation, unless it was scheduled) and initialise variables
+    with span("response setup"):
+        if offset is None:
+            offset = random.randint(0, 360)
+        colour_wheel = create_colour_wheel(offset, settings)
+        mouse = settings["mouse_factory"](visible=True, win=settings["window"])
+        mouse.getPos()
+        marker = make_marker(RADIUS, INNER_RADIUS, settings)
+        marker.colorSpace="hsv"
+        selected_colour = None
+
+    # Count dropped frames (see dashboard.frame_drops) only while the wheel is redrawn every
+    # frame, the other screens of a trial are held for many frames on purpose
+    settings["window"].recordFrameIntervals = settings.get("count_frame_drops", False)
 
     # Wait until participant starts moving the mouse
     while not mouse.mouseMoved():
-        # Draw each wedge
-        for wedge in colour_wheel:
-            wedge.draw()
-
-        # Draw fixation dot
-        draw_fixation_dot(settings)
-
-        # Show retrocue if applicable
-        if retrocue == 0:
-            create_retrocue(target_item, settings)
-
-        # Show additional objects if applicable
-        for object in additional_objects:
-            object.draw()
-
+        with span("response frame"):
+            draw_response_screen(colour_wheel, target_item, retrocue, additional_objects, settings)
         settings["window"].flip()
 
     response_started = time()
@@ -151,31 +163,19 @@ def get_response(
         # Check for pressed 'q'
         check_quit(keyboard)
 
-        # Draw each wedge
-        for wedge in colour_wheel:
-            wedge.draw()
-
-        # Draw fixation dot
-        draw_fixation_dot(settings)
-
-        # Show retrocue if applicable
-        if retrocue == 0:
-            create_retrocue(target_item, settings)
+        with span("response frame"):
+            draw_response_screen(colour_wheel, target_item, retrocue, additional_objects, settings)
 
-        # Show additional objects if applicable
-        for object in additional_objects:
-            object.draw()
-
-        # Move the marker
-        current_colour = move_marker(
-            marker,
-            mouse.getPos(),
-            offset,
-            settings["colours"],
-            RADIUS,
-            INNER_RADIUS,
-            settings,
-        )
+            # Move the marker
+            current_colour = move_marker(
+                marker,
+                mouse.getPos(),
+                offset,
+                settings["colours"],
+                RADIUS,
+                INNER_RADIUS,
+                settings,
+            )
 
         # Flip the display
         settings["window"].flip()
@@ -185,12 +185,13 @@ def get_response(
             selected_colour = current_colour
 
     response_time = time() - response_started
+    settings["window"].recordFrameIntervals = False
 
     if not testing and eyetracker:
         trigger = get_trigger("response_offset", positions, target_item, retrocue)
         eyetracker.tracker.send_message(f"trig{trigger}")
 
-    mouse = event.Mouse(visible=False, win=settings["window"])
+    mouse = settings["mouse_factory"](visible=False, win=settings["window"])
 
     return {
         "idle_reaction_time_in_ms": round(idle_reaction_time * 1000, 2),
@@ -204,6 +205,11 @@ def get_response(
 def wait_for_key(key_list, keyboard):
     keyboard: Keyboard = keyboard
     keyboard.clearEvents()
+
+    # A fake keyboard (see headless.py) can't be waited for through psychopy
+    if getattr(keyboard, "fake", False):
+        return keyboard.waitKeys(keyList=key_list)
+
     keys = event.waitKeys(keyList=key_list)
 
     return keys
@@ -0,0 +1,156 @@
+"""
+This file contains the functions necessary for
+creating the schedule of a whole session (all trials of all blocks) in one go.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import csv
+import numpy as np
+
+POSITIONS = ["left", "right"]
+
+# How long every screen of a trial is shown, in s (see trial.single_trial)
+STIMULUS_DURATION = 0.25
+GAP_DURATION = 0.75
+CUE_DURATION = 0.25
+DELAY_DURATION = 1.00
+SCHEDULE_COLUMNS = [
+    "block",
+    "trial_in_block",
+    "target_item",
+    "informative",
+    "position_1",
+    "position_2",
+    "hue_1",
+    "hue_2",
+    "ITI",
+    "colour_wheel_offset",
+]
+
+
+def balanced_trials(n_trials):
+    """
+    Returns one block of (target_item, informative_cue, loc_1, loc_2) conditions,
+    in which all factors are perfectly balanced (not shuffled yet).
+    """
+    if n_trials % 24 != 0:
+        raise Exception(
+            "Expected number of trials to be divisible by 24, otherwise perfect factorial combinations are not possible."
+        )
+
+    # Generate equal distribution of target items
+    target_item = n_trials // 2 * [1, 2]
+
+    # Generate equal distribution of stimulus 1 locations
+    loc_1 = n_trials // 8 * (n_trials // 6 * ["left"] + n_trials // 6 * ["right"])
+
+    # Generate equal distribution of stimulus 2 locations
+    loc_2 = n_trials // 4 * (n_trials // 12 * ["left"] + n_trials // 12 * ["right"])
+
+    # Generate equal distribution of trials with an informative retrocue
+    informative_cue = n_trials // 3 * [True] + n_trials // 3 * [True] + n_trials // 3 * [False]
+
+    return list(zip(target_item, informative_cue, loc_1, loc_2))
+
+
+def generate_schedule(
+    n_blocks,
+    trials_per_block,
+    seed,
+    max_run_length=None,
+    min_hue_distance=1,
+    iti_range=(500, 800),
+    candidates=1000,
+):
+    """
+    Creates every trial of the session from one seed, as columns (numpy arrays, see SCHEDULE_COLUMNS).
+
+    Constraints:
+     - max_run_length: the same condition (target item, cue and both positions)
+       never occurs more than this many times in a row within a block
+     - min_hue_distance: the two items of a trial are at least this many degrees apart
+       on the colour wheel (1 means they just differ, like random.sample)
+
+    ITIs are drawn from `iti_range` (in ms, inclusive), wheel offsets from 0-360 (inclusive).
+    """
+    if not 1 <= min_hue_distance <= 180:
+        raise ValueError(f"Expected min_hue_distance between 1 and 180, not {min_hue_distance}.")
+
+    rng = np.random.default_rng(seed)
+    n_trials = n_blocks * trials_per_block
+
+    # Encode the balanced block as numbers
+    block = np.array(
+        [
+            (target_item, informative, POSITIONS.index(loc_1), POSITIONS.index(loc_2))
+            for target_item, informative, loc_1, loc_2 in balanced_trials(trials_per_block)
+        ]
+    )
+    condition = block[:, 0] * 8 + block[:, 1] * 4 + block[:, 2] * 2 + block[:, 3]
+
+    # Shuffle every block, trying many orders at once when runs are limited
+    n_candidates = 1 if max_run_length is None else candidates
+    orders = rng.permuted(
+        np.broadcast_to(np.arange(trials_per_block), (n_blocks, n_candidates, trials_per_block)),
+        axis=2,
+    )
+    if max_run_length is None:
+        chosen = orders[:, 0]
+    else:
+        valid = ~too_long_runs(condition[orders], max_run_length)
+        if not valid.any(axis=1).all():
+            raise ValueError(
+                f"Could not find a block order with runs of at most {max_run_length}, "
+                "try a higher max_run_length or more candidates."
+            )
+        chosen = orders[np.arange(n_blocks), valid.argmax(axis=1)]
+
+    trials = block[chosen.ravel()]
+
+    # Colours: the second hue is drawn from the part of the wheel that is far enough away
+    hue_1 = rng.integers(0, 360, n_trials)
+    hue_2 = (hue_1 + rng.integers(min_hue_distance, 360 - min_hue_distance + 1, n_trials)) % 360
+
+    return {
+        "block": np.repeat(np.arange(1, n_blocks + 1), trials_per_block),
+        "trial_in_block": np.tile(np.arange(1, trials_per_block + 1), n_blocks),
+        "target_item": trials[:, 0],
+        "informative": trials[:, 1].astype(bool),
+        "position_1": trials[:, 2],
+        "position_2": trials[:, 3],
+        "hue_1": hue_1,
+        "hue_2": hue_2,
+        "ITI": rng.integers(iti_range[0], iti_range[1] + 1, n_trials),
+        "colour_wheel_offset": rng.integers(0, 361, n_trials),
+    }
+
+
+def too_long_runs(conditions, max_run_length):
+    """For every row of `conditions`, whether some value repeats more than `max_run_length` times in a row."""
+    repeats = conditions[..., 1:] == conditions[..., :-1]
+    if max_run_length > repeats.shape[-1]:
+        return np.zeros(repeats.shape[:-1], dtype=bool)
+
+    windows = np.lib.stride_tricks.sliding_window_view(repeats, max_run_length, axis=-1)
+    return windows.all(axis=-1).any(axis=-1)
+
+
+def schedule_rows(schedule):
+    """Turns the schedule columns into one dict (of plain Python values) per trial."""
+    rows = []
+    for index in range(len(schedule["block"])):
+        row = {column: schedule[column][index].item() for column in SCHEDULE_COLUMNS}
+        row["position_1"] = POSITIONS[row["position_1"]]
+        row["position_2"] = POSITIONS[row["position_2"]]
+        rows.append(row)
+
+    return rows
+
+
+def save_schedule(rows, path):
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=SCHEDULE_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
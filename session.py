@@ -0,0 +1,92 @@
+"""
+This file contains the functions necessary for
+saving the plan of a session, so it can be resumed after a crash.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import json
+import os
+import random
+from time import time
+import numpy as np
+from schedule import generate_schedule, schedule_rows
+
+
+def create_session_plan(
+    n_blocks, trials_per_block, participant, session, age, seed=None, **constraints
+):
+    """
+    Creates the schedule of all blocks up front (see schedule.generate_schedule for the
+    constraints), so it can be checked beforehand and the same trials can be run again on a resume.
+    """
+    # A new seed for every session, saved with the plan
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2**63)
+
+    rows = schedule_rows(generate_schedule(n_blocks, trials_per_block, seed, **constraints))
+
+    return {
+        "participant_number": int(participant),
+        "session_number": int(session),
+        "age": int(age),
+        "seed": seed,
+        "constraints": constraints,
+        "started_at": time(),
+        "blocks": [
+            rows[block * trials_per_block : (block + 1) * trials_per_block]
+            for block in range(n_blocks)
+        ],
+    }
+
+
+def save_plan(plan, path):
+    save_json(plan, path)
+
+
+def load_plan(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_checkpoint(path, completed_trials):
+    # Saved before every trial, so a resumed session draws the same random numbers
+    version, state, gauss = random.getstate()
+    save_json(
+        {
+            "completed_trials": completed_trials,
+            "rng_state": [version, list(state), gauss],
+        },
+        path,
+    )
+
+
+def restore_checkpoint(path, completed_trials):
+    """
+    Restores the random state saved before trial `completed_trials + 1`.
+    Returns False if the checkpoint doesn't belong to that trial.
+    """
+    if not os.path.exists(path):
+        return False
+
+    with open(path) as file:
+        checkpoint = json.load(file)
+
+    if checkpoint["completed_trials"] != completed_trials:
+        return False
+
+    version, state, gauss = checkpoint["rng_state"]
+    random.setstate((version, tuple(state), gauss))
+
+    return True
+
+
+def save_json(content, path):
+    # Write to a temporary file first, so a crash never leaves half a file behind
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(content, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
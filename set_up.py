@@ -6,10 +6,11 @@ To run the 'microsaccade bias temporal separation' experiment, see main.py.
 made by Anna van Harmelen, 2025
 """
 
-from psychopy import visual
-from psychopy.hardware.keyboard import Keyboard
+import os
+import sys
 from math import degrees, atan2
-import numpy as np
+
+BACKENDS = ("screen", "hidden", "offscreen", "software")
 
 
 def get_monitor_and_dir(testing: bool):
@@ -38,15 +39,82 @@ def get_monitor_and_dir(testing: bool):
     return monitor, directory
 
 
-def get_settings(monitor: dict, directory):
+def prepare_backend(backend):
+    """
+    Sets the options `backend` needs (see get_settings). These have to be set before pyglet
+    (and with it psychopy.visual) is imported, so call this before preloading psychopy.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Expected backend to be one of {BACKENDS}, not {backend!r}.")
+
+    if backend == "offscreen":
+        import pyglet
+
+        if pyglet.options["headless"] is not True and "pyglet.window" in sys.modules:
+            print("WARNING: pyglet was imported before the offscreen backend was chosen.")
+        pyglet.options["headless"] = True
+        make_psychopy_headless()
+    elif backend == "software":
+        os.environ["LIBGL_ALWAYS_SOFTWARE"] = "1"
+
+
+def make_psychopy_headless():
+    # psychopy's pyglet backend expects an X11 display and window on Linux:
+    # it asks the display for an X screen and reads the window's X11 handle (_window)
+    import pyglet.canvas
+    import pyglet.window
+
+    class HeadlessDisplay(pyglet.canvas.Display):
+        def __init__(self, name=None, x_screen=None, **kwargs):
+            super().__init__(**kwargs)
+
+    pyglet.canvas.Display = HeadlessDisplay
+    pyglet.window.Window._window = None
+
+
+def get_settings(monitor: dict, directory, backend="screen", fake_hz=None, mouse_driver=None):
+    """
+    backend:
+     - "screen": the real fullscreen window, mouse and keyboard
+     - "hidden": a hidden (not fullscreen) window, e.g. to replay trials without showing them
+     - "offscreen": a window without any display (pyglet headless, needs EGL), e.g. for benchmarks
+     - "software": a hidden window drawn by the software OpenGL renderer (Mesa llvmpipe)
+
+    All but "screen" get a fake mouse and keyboard (see headless.py, `mouse_driver` decides
+    where the mouse goes). With `fake_hz` every flip waits as if the screen refreshes at that rate.
+    """
+    prepare_backend(backend)
+
+    # Only import psychopy here, get_monitor_and_dir is needed before it has loaded
+    from psychopy import visual, event
+    from psychopy.hardware.keyboard import Keyboard
+
+    on_screen = backend == "screen"
+
     # Initialise psychopy window
     window = visual.Window(
         color=([-0.5, -0.5, -0.5]),
         size=monitor["resolution"],
         units="pix",
-        fullscr=True,
+        fullscr=on_screen,
     )
 
+    # psychopy's Window has no option for this, so hide the pyglet window itself
+    if not on_screen:
+        window.winHandle.set_visible(False)
+
+    if on_screen:
+        keyboard = Keyboard()
+        mouse_factory = event.Mouse
+    else:
+        from headless import FakeKeyboard, FakeMouse, pace_flips
+
+        keyboard = FakeKeyboard()
+        mouse_factory = lambda visible=True, win=None: FakeMouse(visible, win, mouse_driver)
+
+        if fake_hz:
+            pace_flips(window, fake_hz)
+
     # Calculate number of visual degrees per pixel on the screen
     degrees_per_pixel = degrees(atan2(0.5 * monitor["width"], monitor["distance"])) / (
         0.5 * monitor["resolution"][0]
@@ -68,8 +136,10 @@ def get_settings(monitor: dict, directory):
         num_segments=num_segments,
         colours=colours,
         window=window,
-        keyboard=Keyboard(),
+        keyboard=keyboard,
         mouse=visual.CustomMouse(win=window, visible=False),
+        mouse_factory=mouse_factory,
+        backend=backend,
         monitor=monitor,
         directory=directory,
     )
@@ -0,0 +1,308 @@
+"""
+This script runs a whole session with a simulated participant, on a headless window
+and a virtual clock, so a session of over an hour takes seconds to minutes.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+usage:
+
+    python simulate.py simulated-data [--sessions 3] [--error-sd 15] [--guess-rate 0.1] [--hz 60]
+
+This writes the same data as a real session (the .csv, .jsonl, .parquet, plan, etc.) to
+the given directory, plus the eyetracker messages (triggers) the session would have sent
+in <session>_<participant>_messages.asc.
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import inspect
+import os
+import random
+from time import time
+
+import numpy as np
+
+from headless import CLOCK_FUNCTIONS, FakeKeyboard, VirtualClock, pace_flips, virtual_time
+
+
+class SimulatedParticipant:
+    """
+    Mouse driver (see headless.FakeMouse) that responds like a participant: it waits for
+    a reaction time, moves the mouse from the centre to the target colour (plus some error)
+    in a straight line, and clicks.
+
+    Errors are normally distributed with `error_sd` degrees (around `bias`), except on a
+    `guess_rate` fraction of the trials, where any colour is picked.
+    """
+
+    def __init__(
+        self,
+        clock,
+        error_sd=15,
+        bias=0,
+        guess_rate=0.1,
+        reaction_time=(0.4, 0.15),
+        movement_time=(0.5, 0.15),
+        seed=None,
+    ):
+        self.clock = clock
+        self.error_sd = error_sd
+        self.bias = bias
+        self.guess_rate = guess_rate
+        self.reaction_time = reaction_time
+        self.movement_time = movement_time
+        self.rng = np.random.default_rng(seed)
+        self.colours = None
+        self.radius = None
+        self.trial = None
+        self.responses = 0
+
+    def respond_to(self, target_colour, offset):
+        """Called at the start of every response, plans where and when to click."""
+        hue = self.colours.index(target_colour)
+
+        if self.rng.random() < self.guess_rate:
+            error = self.rng.uniform(-180, 180)
+        else:
+            error = self.rng.normal(self.bias, self.error_sd)
+
+        # The middle of a wedge, so get_colour returns the intended colour
+        angle = np.radians(hue + offset + round(error) + 0.5)
+
+        reaction_time = max(self.rng.normal(*self.reaction_time), 0.1)
+        self.trial = {
+            "start": self.clock.time(),
+            "reaction_time": reaction_time,
+            "click_time": reaction_time + max(self.rng.normal(*self.movement_time), 0.1),
+            "target": self.radius * np.array([np.cos(angle), np.sin(angle)]),
+        }
+        self.responses += 1
+
+    def __call__(self, mouse):
+        if self.trial is None:
+            return
+
+        since_start = self.clock.time() - self.trial["start"]
+        if since_start < self.trial["reaction_time"]:
+            mouse.moved = False
+            return
+
+        # Move along a straight line and arrive exactly at the click
+        progress = min(
+            (since_start - self.trial["reaction_time"])
+            / (self.trial["click_time"] - self.trial["reaction_time"]),
+            1,
+        )
+        mouse.position = tuple(self.trial["target"] * progress)
+        mouse.moved = True
+        mouse.pressed = [1, 0, 0] if progress == 1 else [0, 0, 0]
+
+
+class SimulatedKeyboard(FakeKeyboard):
+    """Presses SPACE (or the first allowed key) after a break of `break_time` (mean, sd) seconds."""
+
+    def __init__(self, clock, break_time=(20, 10), seed=None):
+        super().__init__()
+        # Not `clock`, that's the keyboard's own clock (reset by get_response)
+        self.virtual_clock = clock
+        self.break_time = break_time
+        self.rng = np.random.default_rng(seed)
+
+    def waitKeys(self, keyList=None, *args, **kwargs):
+        self.virtual_clock.wait(max(self.rng.normal(*self.break_time), 1))
+        return super().waitKeys(keyList)
+
+
+class SimulatedTracker:
+    """Writes every message to the eyetracker to a log file, like in an .asc file ("MSG <time> <message>")."""
+
+    mock = True
+
+    def __init__(self, path, clock):
+        self.clock = clock
+        self.file = open(path, "w")
+
+    def send_message(self, message):
+        self.file.write(f"MSG\t{round(self.clock.time() * 1000)} {message}\n")
+
+    def send_status(self, message):
+        pass
+
+    def close(self):
+        self.file.close()
+
+
+class SimulatedEyelinker:
+    """Stands in for eyetracker.Eyelinker in a simulated session (nothing is recorded, only the messages)."""
+
+    def __init__(self, participant, session, directory, clock):
+        self.tracker = SimulatedTracker(
+            os.path.join(directory, f"{session}_{participant}_messages.asc"), clock
+        )
+        self.transfer = None
+
+    def calibrate(self):
+        pass
+
+    def start(self):
+        self.tracker.send_message("START")
+
+    def recover(self, new_block=False):
+        pass
+
+    def start_trial(self):
+        pass
+
+    def end_trial(self, trial_number):
+        return {}
+
+    def end_segment(self, last_block):
+        return None
+
+    def stop(self, last_block=None):
+        self.tracker.send_message("END")
+        self.tracker.close()
+        return None
+
+    def write_manifest(self):
+        pass
+
+
+class Simulation:
+    """
+    Everything main.main needs to let a simulated participant do the session:
+
+        with Simulation(directory) as simulation:
+            main(simulation=simulation)
+
+    Within the with-block the experiment runs on a virtual clock (see headless.virtual_time).
+    `practice_responses` is how many colour wheel responses and practice trials are done
+    before pressing Q to move on (set `practice=False` when resuming, practice is skipped then).
+    """
+
+    def __init__(
+        self,
+        directory,
+        hz=60,
+        backend="offscreen",
+        practice=True,
+        practice_responses=(3, 2),
+        seed=None,
+        **participant,
+    ):
+        self.directory = directory
+        self.hz = hz
+        self.backend = backend
+        self.practice = practice
+        self.practice_responses = practice_responses
+        # From 0: at the size of the current Unix time a frame is too small a step for a float
+        self.clock = VirtualClock(0.0)
+        self.participant = SimulatedParticipant(self.clock, seed=seed, **participant)
+        self.keyboard = SimulatedKeyboard(self.clock, seed=seed)
+        os.makedirs(directory, exist_ok=True)
+
+    def __enter__(self):
+        from set_up import prepare_backend
+
+        # Before anything imports psychopy (pyglet), see set_up.prepare_backend
+        prepare_backend(self.backend)
+
+        import response
+
+        self.original_get_response = response.get_response
+        functions = {
+            **CLOCK_FUNCTIONS,
+            "main": {"time": "time"},
+            "session": {"time": "time"},
+        }
+        self.clock_context = virtual_time(self.clock, functions)
+        self.clock_context.__enter__()
+
+        # Tell the participant what to respond to (trial.py and practice.py import get_response)
+        import trial
+        import practice
+
+        trial.get_response = practice.get_response = self.get_response
+
+        return self
+
+    def __exit__(self, *exc):
+        import trial
+        import practice
+
+        trial.get_response = practice.get_response = self.original_get_response
+        self.clock_context.__exit__(*exc)
+
+    def get_response(self, *args, **kwargs):
+        arguments = inspect.signature(self.original_get_response).bind(*args, **kwargs).arguments
+
+        # Pick the random offset here (like get_response would), the participant has to know it
+        offset = arguments.get("offset")
+        if offset is None:
+            offset = random.randint(0, 360)
+        arguments["offset"] = offset
+
+        self.participant.respond_to(arguments["target_colour"], offset)
+        self.press_q_after_practice()
+
+        return self.original_get_response(**arguments)
+
+    def press_q_after_practice(self):
+        # Q ends practising the wheel, and then practising full trials
+        # (the response it is pressed at is stopped, so it doesn't count)
+        if not self.practice:
+            return
+
+        wheel, trials = self.practice_responses
+        if self.participant.responses in (wheel + 1, wheel + 1 + trials + 1):
+            self.keyboard.press("q")
+
+    def get_settings(self, monitor, directory):
+        from set_up import get_settings
+        from response import RADIUS, INNER_RADIUS
+
+        settings = get_settings(
+            monitor, directory, backend=self.backend, mouse_driver=self.participant
+        )
+        settings["keyboard"] = self.keyboard
+        pace_flips(settings["window"], self.hz, wait=self.clock.wait, clock=self.clock.time)
+
+        # Where the participant aims: the middle of the colour wheel's ring
+        self.participant.colours = settings["colours"]
+        self.participant.radius = settings["deg2pix"]((RADIUS + INNER_RADIUS) / 2)
+
+        return settings
+
+    def eyelinker(self, participant, session):
+        return SimulatedEyelinker(participant, session, self.directory, self.clock)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", help="where to save the simulated data")
+    parser.add_argument("--sessions", type=int, default=1, help="how many sessions to run")
+    parser.add_argument("--error-sd", type=float, default=15, help="in degrees")
+    parser.add_argument("--guess-rate", type=float, default=0.1)
+    parser.add_argument("--hz", type=float, default=60, help="fake refresh rate")
+    parser.add_argument("--backend", default="offscreen", choices=["offscreen", "software", "hidden"])
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    from main import main
+
+    for index in range(args.sessions):
+        started = time()
+        with Simulation(
+            args.directory,
+            hz=args.hz,
+            backend=args.backend,
+            seed=None if args.seed is None else args.seed + index,
+            error_sd=args.error_sd,
+            guess_rate=args.guess_rate,
+        ) as simulation:
+            main(simulation=simulation)
+
+        print(
+            f"Simulated session {index + 1} in {time() - started:.1f} s "
+            f"({simulation.participant.responses} responses)"
+        )
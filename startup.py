@@ -0,0 +1,92 @@
+"""
+This file contains the functions necessary for
+starting up the experiment quickly, and seeing where the start-up time goes.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import importlib
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+
+class StartupProfile:
+    """
+    Keeps track of how long every start-up phase takes.
+
+    usage:
+
+        profile = StartupProfile(started)
+        with profile.phase("window"):
+            ...
+        profile.report("first instruction screen")
+
+    Phases may run at the same time (on different threads), which shows in their start times.
+    """
+
+    def __init__(self, started=None):
+        self.started = perf_counter() if started is None else started
+        self.phases = []
+        self.lock = threading.Lock()
+
+    def now(self):
+        return perf_counter() - self.started
+
+    def add(self, name, start, end):
+        with self.lock:
+            self.phases.append((name, start, end, threading.current_thread().name))
+
+    @contextmanager
+    def phase(self, name):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add(name, start, self.now())
+
+    def timed(self, name, function):
+        """Wraps `function` so every call is recorded as phase `name`."""
+
+        def wrapped(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+
+        return wrapped
+
+    def report(self, until):
+        total = self.now()
+        lines = [f"Start-up profile, {total * 1000:.0f} ms until {until}:"]
+        for name, start, end, thread in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(
+                f"  {name:<32} {start * 1000:>8.0f} ms -> {end * 1000:>8.0f} ms"
+                f"  ({(end - start) * 1000:>7.0f} ms, {thread})"
+            )
+
+        print("\n".join(lines))
+
+
+def preload(modules, profile=None):
+    """
+    Imports `modules` on a background thread (while the main thread does something else,
+    like waiting for the participant details), so later imports are instant.
+    Returns the thread, join it before using the modules.
+    """
+
+    def load():
+        for module in modules:
+            try:
+                if profile:
+                    with profile.phase(f"import {module}"):
+                        importlib.import_module(module)
+                else:
+                    importlib.import_module(module)
+            except ImportError as e:
+                # The import in the main thread will report this properly
+                print(f"Could not preload {module}: {e}")
+
+    thread = threading.Thread(target=load, name="preload", daemon=True)
+    thread.start()
+
+    return thread
@@ -0,0 +1,135 @@
+"""
+This file contains the functions necessary for
+keeping running statistics of the responses per condition and per block, trial by trial.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+from math import atan2, cos, degrees, log, radians, sin, sqrt
+
+from session import save_json
+
+
+class RunningStats:
+    """Mean and SD that are updated one value at a time (Welford's algorithm)."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def sd(self):
+        return sqrt(self.m2 / (self.n - 1)) if self.n > 1 else None
+
+    def snapshot(self):
+        return {"n": self.n, "mean": self.mean if self.n else None, "sd": self.sd}
+
+
+class CircularStats:
+    """Circular mean and SD of angles in degrees, updated one angle at a time."""
+
+    def __init__(self):
+        self.n = 0
+        self.sum_cos = 0.0
+        self.sum_sin = 0.0
+
+    def add(self, angle):
+        self.n += 1
+        self.sum_cos += cos(radians(angle))
+        self.sum_sin += sin(radians(angle))
+
+    def snapshot(self):
+        if not self.n:
+            return {"n": 0, "mean": None, "sd": None, "resultant_length": None}
+
+        # Mean resultant length: 1 when all angles are equal, 0 when they're uniformly spread
+        resultant_length = min(sqrt(self.sum_cos**2 + self.sum_sin**2) / self.n, 1)
+
+        return {
+            "n": self.n,
+            "mean": degrees(atan2(self.sum_sin, self.sum_cos)),
+            "sd": degrees(sqrt(-2 * log(resultant_length))) if resultant_length > 0 else None,
+            "resultant_length": resultant_length,
+        }
+
+
+class CellStats:
+    """Everything kept per condition cell (or block)."""
+
+    def __init__(self):
+        self.error = RunningStats()
+        self.circular_error = CircularStats()
+        self.performance = RunningStats()
+        self.response_time = RunningStats()
+
+    def add(self, record):
+        self.error.add(record["rgb_distance_signed"])
+        self.circular_error.add(record["rgb_distance_signed"])
+        self.performance.add(record["performance"])
+        self.response_time.add(record["response_time_in_ms"])
+
+    def snapshot(self):
+        return {
+            "rgb_distance_signed": self.error.snapshot(),
+            "rgb_distance_signed_circular": self.circular_error.snapshot(),
+            "performance": self.performance.snapshot(),
+            "response_time_in_ms": self.response_time.snapshot(),
+        }
+
+
+class SessionStats:
+    """
+    Running statistics of a session, grouped by condition cell (cue, target item and
+    both positions), by cue only, and by block.
+
+    usage:
+
+        stats = SessionStats()
+        stats.add(record)                    # after every trial
+        stats.block(1)["performance"]        # e.g. at a break
+        stats.save(path)                     # snapshot of everything, as .json
+    """
+
+    def __init__(self):
+        self.groups = {"condition": {}, "cue": {}, "block": {}}
+        self.total = CellStats()
+
+    def add(self, record):
+        cue = "informative" if record["retrocue"] else "neutral"
+        keys = {
+            "condition": f"{cue}_item{record['target_item']}_"
+            f"{record['positions'][0]}_{record['positions'][1]}",
+            "cue": cue,
+            "block": str(record["block"]),
+        }
+
+        for group, key in keys.items():
+            cells = self.groups[group]
+            if key not in cells:
+                cells[key] = CellStats()
+            cells[key].add(record)
+
+        self.total.add(record)
+
+    def block(self, block):
+        return self.groups["block"][str(block)].snapshot()
+
+    def snapshot(self):
+        return {
+            "total": self.total.snapshot(),
+            **{
+                group: {key: cell.snapshot() for key, cell in sorted(cells.items())}
+                for group, cells in self.groups.items()
+            },
+        }
+
+    def save(self, path):
+        save_json(self.snapshot(), path)
@@ -0,0 +1,342 @@
+"""
+This file contains the functions necessary for
+shipping the data of every lab PC to a central collection server.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+To run a (local) collection server that stores everything in DIRECTORY:
+
+    python sync.py DIRECTORY --port 8000
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import hashlib
+import http.client
+import http.server
+import json
+import os
+import socket
+import threading
+from time import sleep, time
+from urllib.parse import urlsplit, quote, unquote
+
+CHUNK_SIZE = 1 << 20  # bytes
+
+# Files that are still being written or only matter locally
+SKIPPED_SUFFIXES = (".part.edf", ".tmp", ".lock", ".db-journal")
+STATE_FILE = ".sync_state.json"
+
+
+class SyncAgent(threading.Thread):
+    """
+    Watches the data directory and uploads new or changed files to the collection server.
+
+    usage:
+
+        agent = SyncAgent(directory, "http://server:8000")
+        agent.start()    # starts paused, no I/O during practice or trials
+        agent.resume()   # during breaks
+        agent.pause()    # at the start of a block
+        agent.stop()     # one last scan at the end
+
+    Files are identified by their sha256, so the server never receives the same content twice.
+    They are sent in chunks of CHUNK_SIZE over one kept-alive connection, and every request is
+    retried a few times with an increasing delay. The agent only works while resumed,
+    and checks between chunks (when hashing and when uploading), so it stops within one
+    chunk when a block starts.
+    """
+
+    def __init__(self, directory, url, scan_interval=10, retries=3):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.pool = ConnectionPool(url)
+        self.scan_interval = scan_interval
+        self.retries = retries
+        self.host = socket.gethostname()
+
+        # Paused until the first resume
+        self.allowed = threading.Event()
+        self.stopped = threading.Event()
+        self.finish = True
+        self.state_file = os.path.join(directory, STATE_FILE)
+        self.state = load_state(self.state_file)
+
+    def pause(self):
+        self.allowed.clear()
+
+    def resume(self):
+        self.allowed.set()
+
+    def stop(self, finish=True):
+        """Stops the agent, after one last scan when `finish` is True."""
+        self.finish = finish
+        self.stopped.set()
+        self.allowed.set()
+        self.join()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.allowed.wait()
+            self.try_sync()
+            self.stopped.wait(self.scan_interval)
+
+        if self.finish:
+            self.try_sync()
+
+        self.pool.close()
+
+    def try_sync(self):
+        try:
+            self.sync_all()
+        except Exception as e:
+            print(f"Sync of {self.directory} failed: {e.__class__.__name__}: {e}")
+
+    def sync_all(self):
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if (
+                name == STATE_FILE
+                or name.endswith(SKIPPED_SUFFIXES)
+                or not os.path.isfile(path)
+            ):
+                continue
+
+            # Only look at the content when the file has changed since the last upload
+            stat = os.stat(path)
+            known = self.state.get(name)
+            if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+                continue
+
+            self.allowed.wait()
+            checksum = file_checksum(path, self.allowed)
+            if checksum is None or not self.upload(name, path, checksum):
+                return  # paused in the middle, try again later
+
+            self.state[name] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "sha256": checksum,
+                "uploaded_at": time(),
+            }
+            save_state(self.state, self.state_file)
+
+    def upload(self, name, path, checksum):
+        # The server may already have this content (e.g. from another PC)
+        status, _ = self.request("HEAD", f"/files/{checksum}")
+        if status != 200:
+            with open(path, "rb") as file:
+                index = 0
+                for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                    if not self.allowed.is_set():
+                        return False
+                    self.request("PUT", f"/files/{checksum}/chunks/{index}", chunk)
+                    index += 1
+
+            self.request("POST", f"/files/{checksum}/complete", b"")
+
+        # Register which file on which PC has this content
+        self.request(
+            "POST",
+            f"/names/{quote(self.host)}/{quote(name)}",
+            json.dumps({"sha256": checksum}).encode(),
+        )
+
+        return True
+
+    def request(self, method, path, body=None):
+        for attempt in range(1, self.retries + 1):
+            try:
+                status, response = self.pool.request(method, path, body)
+                if status < 500:
+                    if method != "HEAD" and status >= 400:
+                        raise IOError(f"{method} {path} returned {status}: {response!r}")
+                    return status, response
+            except (OSError, http.client.HTTPException) as e:
+                if attempt == self.retries:
+                    raise
+                print(f"{method} {path} failed ({e}), retrying...")
+            sleep(0.5 * 2**attempt)
+
+        raise IOError(f"{method} {path} kept failing.")
+
+
+class ConnectionPool:
+    """Keeps connections to the server open, so they are reused for every request."""
+
+    def __init__(self, url, size=2, timeout=30):
+        parts = urlsplit(url)
+        self.connection_type = (
+            http.client.HTTPSConnection
+            if parts.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.address = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.idle = []
+        self.size = size
+        self.lock = threading.Lock()
+
+    def request(self, method, path, body=None):
+        with self.lock:
+            connection = (
+                self.idle.pop()
+                if self.idle
+                else self.connection_type(self.address, timeout=self.timeout)
+            )
+
+        try:
+            connection.request(method, self.prefix + path, body=body)
+            response = connection.getresponse()
+            content = response.read()
+        except Exception:
+            # Don't reuse a connection in an unknown state
+            connection.close()
+            raise
+
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(connection)
+            else:
+                connection.close()
+
+        return response.status, content
+
+    def close(self):
+        with self.lock:
+            for connection in self.idle:
+                connection.close()
+            self.idle = []
+
+
+def file_checksum(path, allowed=None):
+    """Returns the sha256 of the file, or None when the `allowed` event is cleared in between chunks."""
+    checksum = hashlib.sha256()
+    with open(path, "rb") as file:
+        while allowed is None or allowed.is_set():
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                return checksum.hexdigest()
+            checksum.update(chunk)
+
+    return None
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_state(state, path):
+    with open(path + ".tmp", "w") as file:
+        json.dump(state, file)
+    os.replace(path + ".tmp", path)
+
+
+class CollectionHandler(http.server.BaseHTTPRequestHandler):
+    """
+    A minimal collection server, storing files by their sha256 in `server.directory`
+    (and `names.jsonl` with which PC sent which file). Useful as a stand-in in tests.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        _, checksum = self.path.strip("/").split("/")[:2]
+        self.reply(200 if os.path.exists(self.stored(checksum)) else 404)
+
+    def do_PUT(self):
+        _, checksum, _, index = self.path.strip("/").split("/")
+        with open(f"{self.stored(checksum)}.chunk{int(index):06d}", "wb") as file:
+            file.write(self.body())
+        self.reply(201)
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        body = self.body()
+
+        if parts[0] == "files":
+            self.complete(parts[1])
+        elif parts[0] == "names":
+            with open(os.path.join(self.server.directory, "names.jsonl"), "a") as file:
+                file.write(
+                    json.dumps(
+                        {
+                            "host": unquote(parts[1]),
+                            "name": unquote(parts[2]),
+                            "sha256": json.loads(body)["sha256"],
+                            "received_at": time(),
+                        }
+                    )
+                    + "\n"
+                )
+            self.reply(201)
+        else:
+            self.reply(404)
+
+    def complete(self, checksum):
+        target = self.stored(checksum)
+        chunks = sorted(
+            name
+            for name in os.listdir(self.server.directory)
+            if name.startswith(f"{checksum}.chunk")
+        )
+
+        with open(target + ".tmp", "wb") as file:
+            for name in chunks:
+                with open(os.path.join(self.server.directory, name), "rb") as chunk:
+                    file.write(chunk.read())
+
+        # Only keep the file when all chunks arrived intact
+        if file_checksum(target + ".tmp") != checksum:
+            os.remove(target + ".tmp")
+            self.reply(422)
+            return
+
+        os.replace(target + ".tmp", target)
+        for name in chunks:
+            os.remove(os.path.join(self.server.directory, name))
+        self.reply(201)
+
+    def stored(self, checksum):
+        if len(checksum) != 64 or not all(c in "0123456789abcdef" for c in checksum):
+            raise ValueError(f"Not a sha256: {checksum!r}")
+        return os.path.join(self.server.directory, checksum)
+
+    def body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def reply(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_collection_server(directory, port=0):
+    """Starts a collection server on a background thread, returns it (see `server.server_port`)."""
+    os.makedirs(directory, exist_ok=True)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), CollectionHandler)
+    server.directory = directory
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", help="where to store the collected files")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    server = http.server.ThreadingHTTPServer(("", args.port), CollectionHandler)
+    server.directory = args.directory
+    print(f"Collecting into {args.directory} on port {args.port}")
+    server.serve_forever()
@@ -0,0 +1,65 @@
+"""
+Checks that a synthetic .asc file (see asc.write_synthetic_asc) is read back as it was written,
+run with: python -m pytest test_asc.py
+
+made by Anna van Harmelen, 2025
+"""
+
+import os
+
+import numpy as np
+
+from asc import EVENTS, load_events, load_samples, parse_asc, write_synthetic_asc
+from audit import read_triggers
+
+SECONDS = 20
+RATE = 500
+N_TRIALS = 4
+
+# See write_synthetic_asc: the first sample's time, and when every trial's triggers come
+START_TIME = 1_000_000
+TRIGGER_DELAYS = [0, 1000, 2000, 3250]
+
+
+def test_synthetic_asc_round_trip(tmp_path):
+    path = os.path.join(tmp_path, "synthetic.asc")
+    onsets, displacements = write_synthetic_asc(path, seconds=SECONDS, rate=RATE, n_trials=N_TRIALS)
+    assert len(onsets) == len(displacements) == SECONDS
+
+    prefix = parse_asc(path, os.path.join(tmp_path, "parsed"))
+    samples = load_samples(prefix)
+    events = load_events(prefix)
+
+    # One sample every 1000 / RATE ms
+    assert len(samples) == SECONDS * RATE
+    assert np.array_equal(samples["time"], START_TIME + np.arange(SECONDS * RATE) * 1000 // RATE)
+
+    # Every trial's four triggers (frame 1-4 and the same condition), 4 s apart
+    expected_times = [
+        START_TIME + 1000 + trial * 4000 + delay for trial in range(N_TRIALS) for delay in TRIGGER_DELAYS
+    ]
+    triggers = events["triggers"]
+    assert np.array_equal(triggers["time"], expected_times)
+    assert np.array_equal(triggers["code"] // 10, [1, 2, 3, 4] * N_TRIALS)
+    conditions = (triggers["code"] % 10).reshape(N_TRIALS, 4)
+    assert np.all(conditions == conditions[:, :1])
+    assert np.all((conditions >= 1) & (conditions <= 8))
+
+    # audit.py reads the same triggers straight from the .asc file
+    times, codes = read_triggers(path)
+    assert np.array_equal(times, triggers["time"])
+    assert np.array_equal(codes, triggers["code"])
+
+    # A blink for every stretch of missing samples, and nothing else
+    blinks = events["blinks"]
+    assert len(blinks) >= 1
+    missing = np.isnan(samples["x"])
+    edges = np.diff(np.r_[0, missing.astype(int), 0])
+    assert np.array_equal(blinks["start"], samples["time"][edges[:-1] == 1])
+    assert np.array_equal(blinks["end"], samples["time"][edges[1:] == -1])
+    assert np.all(np.isnan(samples["y"][missing]))
+    assert not np.isnan(samples["pupil"][~missing]).any()
+
+    # No other events in the synthetic recording
+    assert set(EVENTS) <= set(events)
+    assert len(events["fixations"]) == len(events["saccades"]) == 0
@@ -0,0 +1,47 @@
+"""
+Checks that a short simulated session (see simulate.py) runs to the end.
+Needs psychopy and a headless OpenGL (EGL), run with: python -m pytest test_simulate.py
+
+made by Anna van Harmelen, 2025
+"""
+
+import glob
+import os
+import signal
+
+import pytest
+
+pytest.importorskip("psychopy")
+
+# A simulated session takes seconds, anything much longer is a hang
+TIMEOUT = 300
+
+
+def test_short_session_finishes(tmp_path, monkeypatch):
+    import main
+    from datalog import read_trial_log
+    from simulate import Simulation
+
+    # Two blocks (the long break is after the first) of the smallest balanced number of trials
+    monkeypatch.setattr(main, "N_BLOCKS", 2)
+    monkeypatch.setattr(main, "TRIALS_PER_BLOCK", 24)
+    monkeypatch.setattr(main, "DASHBOARD_PORT", None)
+    monkeypatch.setattr(main, "SYNC_URL", None)
+
+    def timed_out(*args):
+        raise TimeoutError(f"The simulated session took over {TIMEOUT} s")
+
+    previous = signal.signal(signal.SIGALRM, timed_out)
+    signal.alarm(TIMEOUT)
+    try:
+        with Simulation(str(tmp_path), practice_responses=(1, 1), seed=1) as simulation:
+            main.main(simulation=simulation)
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+    (log,) = glob.glob(os.path.join(tmp_path, "data_session_*[0-9].jsonl"))
+    records = read_trial_log(log)
+    assert len(records) == 2 * 24
+    # Responses take (virtual) time, so the clock kept moving
+    assert all(record["response_time_in_ms"] > 0 for record in records)
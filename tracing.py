@@ -0,0 +1,197 @@
+"""
+This file contains the functions necessary for
+tracing where the time goes during a session (which parts of a trial take how long).
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+usage:
+
+    from tracing import span, traced
+
+    @traced("generate trial")
+    def generate_trial_characteristics(...):
+        ...
+
+    with span("response setup"):
+        ...
+
+Nothing is recorded (and spans cost next to nothing) until tracing.start() is called.
+tracing.stop() returns the Tracer, to save a Chrome/Perfetto trace and print a summary.
+
+made by Anna van Harmelen, 2025
+"""
+
+import itertools
+import json
+import threading
+from contextlib import nullcontext
+from functools import wraps
+from time import perf_counter_ns
+
+import numpy as np
+
+# Upper bounds of the summary's histogram bins, in ms
+HISTOGRAM_BINS = [0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, float("inf")]
+
+_tracer = None
+_off = nullcontext()
+
+
+class Tracer:
+    """
+    Spans (name, start, end, thread) in preallocated arrays, so recording one is only a few
+    assignments. Spans that don't fit in `capacity` are counted, but not kept.
+    """
+
+    def __init__(self, capacity=1 << 20):
+        self.capacity = capacity
+        self.origin = perf_counter_ns()
+        self.names = {}
+        self.name_ids = np.zeros(capacity, dtype="int32")
+        self.starts = np.zeros(capacity, dtype="int64")
+        self.ends = np.zeros(capacity, dtype="int64")
+        self.threads = np.zeros(capacity, dtype="int64")
+        self.counter = itertools.count()
+        self.size = None
+        self.dropped = 0
+
+    def record(self, name, start, end):
+        # next() on a count is atomic, so threads never get the same slot
+        index = next(self.counter)
+        if index >= self.capacity:
+            return
+
+        name_id = self.names.get(name)
+        if name_id is None:
+            name_id = self.names.setdefault(name, len(self.names))
+
+        self.name_ids[index] = name_id
+        self.starts[index] = start
+        self.ends[index] = end
+        self.threads[index] = threading.get_ident()
+
+    def finish(self):
+        recorded = next(self.counter)
+        self.size = min(recorded, self.capacity)
+        self.dropped = recorded - self.size
+
+    def spans(self):
+        """Returns {name: durations in ms} of all recorded spans."""
+        names = {name_id: name for name, name_id in self.names.items()}
+        durations = (self.ends[: self.size] - self.starts[: self.size]) / 1e6
+
+        return {
+            names[name_id]: durations[self.name_ids[: self.size] == name_id]
+            for name_id in np.unique(self.name_ids[: self.size])
+        }
+
+    def save_chrome_trace(self, path):
+        """Saves the spans as a Chrome trace (open in chrome://tracing or ui.perfetto.dev)."""
+        names = {name_id: name for name, name_id in self.names.items()}
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        thread_ids = {ident: index for index, ident in enumerate(np.unique(self.threads[: self.size]))}
+
+        events = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 1,
+                "tid": tid,
+                "args": {"name": thread_names.get(ident, f"thread {ident}")},
+            }
+            for ident, tid in thread_ids.items()
+        ]
+        for index in np.argsort(self.starts[: self.size], kind="stable"):
+            events.append(
+                {
+                    "name": names[self.name_ids[index]],
+                    "ph": "X",
+                    "ts": (self.starts[index] - self.origin) / 1e3,
+                    "dur": (self.ends[index] - self.starts[index]) / 1e3,
+                    "pid": 1,
+                    "tid": thread_ids[self.threads[index]],
+                }
+            )
+
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    def report(self):
+        """Prints, for every kind of span, its latencies and a histogram."""
+        labels = [f"<{bound:g}" for bound in HISTOGRAM_BINS[:-1]] + [f">={HISTOGRAM_BINS[-2]:g}"]
+        lines = [
+            f"Trace of {self.size} spans ({self.dropped} dropped), times in ms:",
+            f"  {'':<28} {'n':>7} {'median':>8} {'p95':>8} {'max':>8}  "
+            + "".join(f"{label:>7}" for label in labels),
+        ]
+
+        for name, durations in sorted(self.spans().items()):
+            counts = np.histogram(durations, bins=[0] + HISTOGRAM_BINS)[0]
+            lines.append(
+                f"  {name:<28} {len(durations):>7} {np.median(durations):>8.2f} "
+                f"{np.percentile(durations, 95):>8.2f} {durations.max():>8.2f}  "
+                + "".join(f"{count:>7}" for count in counts)
+            )
+
+        print("\n".join(lines))
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, perf_counter_ns())
+
+
+def span(name):
+    """Context manager that records how long its with-block takes (when tracing)."""
+    if _tracer is None:
+        return _off
+
+    return _Span(_tracer, name)
+
+
+def traced(name):
+    """Decorator that records every call of the function as a span called `name` (when tracing)."""
+
+    def decorator(function):
+        @wraps(function)
+        def wrapped(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return function(*args, **kwargs)
+
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.record(name, start, perf_counter_ns())
+
+        return wrapped
+
+    return decorator
+
+
+def start(capacity=1 << 20):
+    global _tracer
+    _tracer = Tracer(capacity)
+
+    return _tracer
+
+
+def stop():
+    """Stops tracing, returns the Tracer (or None if it wasn't tracing)."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+
+    if tracer:
+        tracer.finish()
+
+    return tracer
@@ -17,9 +17,12 @@ from stimuli import (
     show_text,
 )
 from eyetracker import get_trigger
+from tracing import span, traced
+from schedule import STIMULUS_DURATION, GAP_DURATION, CUE_DURATION, DELAY_DURATION
 import random
 
 
+@traced("generate trial")
 def generate_trial_characteristics(conditions, settings):
     # Extract condition information
     target_item, informative, *positions = conditions
@@ -49,14 +52,35 @@ def generate_trial_characteristics(conditions, settings):
     }
 
 
-def do_while_showing(waiting_time, something_to_do, window):
+@traced("generate trial")
+def schedule_characteristics(row, settings):
+    """Same as generate_trial_characteristics, but for a row of a precomputed schedule (see schedule.py)."""
+    stimuli_colours = [settings["colours"][row["hue_1"]], settings["colours"][row["hue_2"]]]
+    positions = [row["position_1"], row["position_2"]]
+    target_item = row["target_item"]
+
+    return {
+        "ITI": row["ITI"],
+        "stimuli_colours": stimuli_colours,
+        "positions": positions,
+        "probe_colour": stimuli_colours[target_item - 1],
+        "target_item": target_item,
+        "target_colour": stimuli_colours[target_item - 1],
+        "target_position": positions[target_item - 1],
+        "retrocue": target_item if row["informative"] else 0,
+        "colour_wheel_offset": row["colour_wheel_offset"],
+    }
+
+
+def do_while_showing(waiting_time, something_to_do, window, name="draw screen"):
     """
     Show whatever is drawn to the screen for exactly `waiting_time` period,
-    while doing `something_to_do` in the mean time.
+    while doing `something_to_do` in the mean time (traced as `name`).
     """
     window.flip()
     start = time()
-    something_to_do()
+    with span(name):
+        something_to_do()
     wait(waiting_time - (time() - start))
 
 
@@ -72,6 +96,7 @@ def single_trial(
     settings,
     testing,
     eyetracker=None,
+    colour_wheel_offset=None,
 ):
     # Initial fixation cross to eliminate jitter caused by for loop
     draw_fixation_dot(settings)
@@ -80,23 +105,23 @@ def single_trial(
         (0, lambda: 0 / 0, None),  # initial one to make life easier
         (ITI / 1000, lambda: draw_fixation_dot(settings), None),
         (
-            0.25,
+            STIMULUS_DURATION,
             lambda: create_stimuli_frame(stimuli_colours[0], positions[0], settings),
             "stimulus_onset_1",
         ),
-        (0.75, lambda: draw_fixation_dot(settings), None),
+        (GAP_DURATION, lambda: draw_fixation_dot(settings), None),
         (
-            0.25,
+            STIMULUS_DURATION,
             lambda: create_stimuli_frame(stimuli_colours[1], positions[1], settings),
             "stimulus_onset_2",
         ),
-        (0.75, lambda: draw_fixation_dot(settings), None),
+        (GAP_DURATION, lambda: draw_fixation_dot(settings), None),
         (
-            0.25,
+            CUE_DURATION,
             lambda: create_cue_frame(retrocue, settings),
             "cue_onset",
         ),
-        (1.00, lambda: draw_fixation_dot(settings), None),
+        (DELAY_DURATION, lambda: draw_fixation_dot(settings), None),
     ]
 
     # !!! The timing you pass to do_while_showing is the timing for the previously drawn screen. !!!
@@ -110,7 +135,12 @@ def single_trial(
         check_quit(settings["keyboard"])
 
         # Draw the next screen while showing the current one
-        do_while_showing(duration, screens[index + 1][1], settings["window"])
+        do_while_showing(
+            duration,
+            screens[index + 1][1],
+            settings["window"],
+            f"draw {screens[index + 1][2] or 'fixation'}",
+        )
 
     # The for loop only draws the last frame, never shows it
     # So show it here + wait
@@ -125,6 +155,7 @@ def single_trial(
         settings,
         testing,
         eyetracker,
+        offset=colour_wheel_offset,
     )
 
     # Show performance
@@ -0,0 +1,128 @@
+"""
+This file contains the functions necessary for
+keeping the trial data in typed columns and saving them in a columnar file.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import numpy as np
+
+POSITIONS = ["left", "right"]
+
+# Column name: (type, how to get it from a trial record)
+# Colours are saved as their (integer) hue, times in seconds since the start of the session.
+TRIAL_SCHEMA = {
+    "trial_number": ("int32", lambda r: r["trial_number"]),
+    "block": ("int16", lambda r: r["block"]),
+    "start_time": ("float64", lambda r: seconds(r["start_time"])),
+    "end_time": ("float64", lambda r: seconds(r["end_time"])),
+    "ITI": ("int16", lambda r: r["ITI"]),
+    "stimulus_1_hue": ("int16", lambda r: r["stimuli_colours"][0][0]),
+    "stimulus_2_hue": ("int16", lambda r: r["stimuli_colours"][1][0]),
+    "position_1": ("category", lambda r: r["positions"][0]),
+    "position_2": ("category", lambda r: r["positions"][1]),
+    "probe_hue": ("int16", lambda r: r["probe_colour"][0]),
+    "target_item": ("int8", lambda r: r["target_item"]),
+    "target_hue": ("int16", lambda r: r["target_colour"][0]),
+    "target_position": ("category", lambda r: r["target_position"]),
+    "retrocue": ("int8", lambda r: r["retrocue"]),
+    "condition_code": ("int16", lambda r: int(r["condition_code"])),
+    "idle_reaction_time_in_ms": ("float64", lambda r: r["idle_reaction_time_in_ms"]),
+    "response_time_in_ms": ("float64", lambda r: r["response_time_in_ms"]),
+    "selected_hue": ("int16", lambda r: r["selected_colour"][0]),
+    "colour_wheel_offset": ("int16", lambda r: r["colour_wheel_offset"]),
+    "abs_rgb_distance": ("int16", lambda r: r["abs_rgb_distance"]),
+    "rgb_distance": ("int16", lambda r: r["rgb_distance"]),
+    "rgb_distance_signed": ("int16", lambda r: r["rgb_distance_signed"]),
+    "performance": ("int16", lambda r: r["performance"]),
+    "link_samples": ("int32", lambda r: r["link_samples"]),
+    "link_gaps": ("int32", lambda r: r["link_gaps"]),
+    "link_dropped_samples": ("int32", lambda r: r["link_dropped_samples"]),
+    "link_longest_gap_ms": ("float64", lambda r: r["link_longest_gap_ms"]),
+}
+
+
+class TrialTable:
+    """
+    Trial data in preallocated, typed columns (see TRIAL_SCHEMA).
+
+    usage:
+
+        table = TrialTable(n_trials)
+        table.add(record)    # after every trial
+        table.save(path)     # writes path.parquet (or path.npz without a parquet engine)
+
+    Values missing from a record (e.g. the link_* columns when testing)
+    are saved as NaN for floats and -1 for integers and positions.
+    """
+
+    def __init__(self, n_rows):
+        self.n_rows = 0
+        self.columns = {
+            name: np.full(
+                n_rows,
+                np.nan if dtype == "float64" else -1,
+                dtype="int8" if dtype == "category" else dtype,
+            )
+            for name, (dtype, _) in TRIAL_SCHEMA.items()
+        }
+
+    def add(self, record: dict):
+        if self.n_rows == len(self.columns["trial_number"]):
+            raise Exception(f"Trial table is full ({self.n_rows} rows).")
+
+        for name, (dtype, get) in TRIAL_SCHEMA.items():
+            try:
+                value = get(record)
+            except (KeyError, TypeError):
+                continue
+
+            # Categories are stored as their index
+            if dtype == "category":
+                value = POSITIONS.index(value)
+
+            self.columns[name][self.n_rows] = value
+
+        self.n_rows += 1
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                name: (
+                    pd.Categorical.from_codes(
+                        self.columns[name][: self.n_rows], categories=POSITIONS
+                    )
+                    if dtype == "category"
+                    else self.columns[name][: self.n_rows]
+                )
+                for name, (dtype, _) in TRIAL_SCHEMA.items()
+            }
+        )
+
+    def save(self, path):
+        """Saves the table next to the .csv, returns the name of the file that was written."""
+        try:
+            self.to_dataframe().to_parquet(f"{path}.parquet", index=False)
+            return f"{path}.parquet"
+        except ImportError:
+            # No parquet engine (pyarrow or fastparquet) installed
+            np.savez_compressed(
+                f"{path}.npz",
+                **{name: column[: self.n_rows] for name, column in self.columns.items()},
+                position_categories=np.array(POSITIONS),
+            )
+            return f"{path}.npz"
+
+
+def seconds(timedelta_string):
+    # Parses str(datetime.timedelta), e.g. '1:02:03.456789' or '1 day, 0:00:01'
+    days = 0
+    if "day" in timedelta_string:
+        day_part, timedelta_string = timedelta_string.split(", ")
+        days = int(day_part.split()[0])
+
+    hours, minutes, seconds = timedelta_string.split(":")
+    return days * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
@@ -0,0 +1,97 @@
+"""
+This file contains the functions necessary for
+drawing every kind of stimulus once before the experiment starts, so the first trials don't
+pay for compiling shaders, uploading textures and laying out fonts.
+To run the 'microsaccade bias temporal separation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+from time import perf_counter
+
+from stimuli import (
+    draw_fixation_dot,
+    draw_item,
+    create_colour_wheel,
+    create_retrocue,
+    show_text,
+)
+from response import make_marker, move_marker, RADIUS, INNER_RADIUS
+
+
+def stimulus_variants(settings):
+    """
+    Returns {name: function that draws it} for every stimulus shown during a trial.
+    The colour wheel and marker are made once per response and then drawn every frame, so
+    they are made here once and the same objects are drawn every time. The other stimuli
+    are made by the functions that draw them (also during trials).
+    """
+    colour = settings["colours"][0]
+
+    wedges = create_colour_wheel(0, settings)
+    response_marker = make_marker(RADIUS, INNER_RADIUS, settings)
+    response_marker.colorSpace = "hsv"
+
+    def colour_wheel():
+        for wedge in wedges:
+            wedge.draw()
+
+    def marker():
+        move_marker(
+            response_marker, (100, 0), 0, settings["colours"], RADIUS, INNER_RADIUS, settings
+        )
+
+    return {
+        "fixation dot": lambda: draw_fixation_dot(settings),
+        "item left": lambda: draw_item(colour, "left", settings),
+        "item right": lambda: draw_item(colour, "right", settings),
+        "colour wheel": colour_wheel,
+        "marker": marker,
+        "cue 1": lambda: create_retrocue(1, settings),
+        "cue 2": lambda: create_retrocue(2, settings),
+        # All digits the feedback can show
+        "feedback": lambda: show_text(
+            "0123456789", settings["window"], (0, settings["deg2pix"](0.3))
+        ),
+    }
+
+
+def warm_up(settings):
+    """
+    Draws every stimulus twice to the back buffer (it's cleared, never flipped) and returns
+    how long the first and second draw took, in ms. Warns about stimuli that are still slow
+    the second time (slower than the first draw and a quarter of a frame).
+    """
+    window = settings["window"]
+    quarter_frame = 1000 / settings["monitor"]["Hz"] / 4
+    results = {}
+
+    for name, draw in stimulus_variants(settings).items():
+        times = []
+        for _ in range(2):
+            started = perf_counter()
+            draw()
+            finish_drawing()
+            times.append((perf_counter() - started) * 1000)
+
+        results[name] = {"first_ms": times[0], "second_ms": times[1]}
+        if times[1] > quarter_frame and times[1] >= times[0]:
+            print(
+                f"WARNING: drawing the {name} still took {times[1]:.1f} ms "
+                f"after warming up (first time {times[0]:.1f} ms)."
+            )
+
+    # Nothing of this should ever be shown
+    window.clearBuffer()
+
+    return results
+
+
+def finish_drawing():
+    # Wait until the GPU has actually drawn everything, otherwise only queueing is timed
+    try:
+        from pyglet import gl
+
+        gl.glFinish()
+    except ImportError:
+        pass